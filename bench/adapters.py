@@ -0,0 +1,157 @@
+import requests
+
+from .fakes import parse_twitter_date
+
+# Minimal stand-ins for the parts of tweepy and praw the bot uses. tweepy and praw hard-code https hosts
+# (and praw's media upload and websocket flows), so instead of pointing them at the fake server these
+# adapters make the same HTTP round trips to it themselves: latency and bytes are real, parsing is not.
+
+class Obj:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+def status_from_json(data):
+    return Obj(id=data['id'],
+               created_at=parse_twitter_date(data['created_at']),
+               full_text=data['full_text'],
+               display_text_range=data['display_text_range'],
+               in_reply_to_status_id=data['in_reply_to_status_id'],
+               in_reply_to_user_id=data['in_reply_to_user_id'],
+               user=Obj(**data['user']),
+               entities=data['entities'],
+               extended_entities=data['extended_entities'])
+
+class FakeTweepy:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    def AppAuthHandler(self, consumer_key, consumer_secret):
+        # Like tweepy, the bearer token is fetched when the handler is built
+        response = self.session.post(self.base_url + '/twitter/oauth2/token', data={'grant_type': 'client_credentials'}, auth=(consumer_key, consumer_secret))
+        response.raise_for_status()
+        return Obj(consumer_key=consumer_key, token=response.json()['access_token'])
+
+    def API(self, auth):
+        return FakeTwitterAPI(self)
+
+class FakeTwitterAPI:
+    def __init__(self, tweepy):
+        self.tweepy = tweepy
+
+    def _get(self, path, params):
+        response = self.tweepy.session.get(self.tweepy.base_url + '/twitter/1.1' + path, params=params)
+        response.raise_for_status()
+        return [status_from_json(data) for data in response.json()]
+
+    def user_timeline(self, **kwargs):
+        return self._get('/statuses/user_timeline.json', kwargs)
+
+    def statuses_lookup(self, id_, **kwargs):
+        return self._get('/statuses/lookup.json', dict(kwargs, id=','.join(str(tweet_id) for tweet_id in id_)))
+
+class FakePraw:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    def Reddit(self, **kwargs):
+        return FakeReddit(self, kwargs)
+
+class RedditAPIException(Exception):
+    # Shaped like praw's: one item per error in the response's json.errors
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.items = [Obj(error_type=error_type, message=message, field=field) for error_type, message, field in errors]
+
+class FakeReddit:
+    def __init__(self, praw, credentials):
+        self.praw = praw
+        self.credentials = credentials
+        self.token = None
+        # praw sends every API request through the requestor's session when one is given
+        self.session = credentials.get('requestor_kwargs', {}).get('session') or praw.session
+
+    def authorize(self):
+        # praw fetches the script-app token on the first request and reuses it until it expires
+        if self.token is None:
+            response = self.session.post(self.praw.base_url + '/reddit/api/v1/access_token', data={'grant_type': 'password'})
+            response.raise_for_status()
+            self.token = response.json()['access_token']
+
+    def post(self, path, data=None, files=None):
+        self.authorize()
+        response = self.session.post(self.praw.base_url + '/reddit' + path, data=data, files=files)
+        response.raise_for_status()
+        data = response.json() if response.content else None
+        if data and data.get('json', {}).get('errors'):
+            raise RedditAPIException(data['json']['errors'])
+        return data
+
+    def upload(self, path):
+        # Same two round trips as praw: upload lease, then the file to the lease's upload target
+        lease = self.post('/api/media/asset.json', data={'filepath': str(path), 'mimetype': 'image/jpeg'})
+        with open(path, 'rb') as media:
+            self.praw.session.post(lease['args']['action'], files={'file': media}).raise_for_status()
+        return lease['asset']['asset_id']
+
+    def subreddit(self, name):
+        return FakeSubreddit(self, name)
+
+    def submission(self, id):
+        return FakeThing(self, 't3', id)
+
+    def comment(self, id):
+        return FakeThing(self, 't1', id)
+
+class FakeSubreddit:
+    def __init__(self, reddit, name):
+        self.reddit = reddit
+        self.display_name = name
+
+    def __str__(self):
+        return self.display_name
+
+    def _submission(self, response):
+        data = response['json']['data']
+        return FakeThing(self.reddit, 't3', data['id'])
+
+    def submit(self, title, url, flair_id=None):
+        return self._submission(self.reddit.post('/api/submit', {'title': title, 'url': url, 'kind': 'link'}))
+
+    def submit_image(self, title, image_path, flair_id=None):
+        asset_id = self.reddit.upload(image_path)
+        return self._submission(self.reddit.post('/api/submit', {'title': title, 'kind': 'image', 'url': asset_id}))
+
+    def submit_gallery(self, title, images, flair_id=None):
+        items = [{'media_id': self.reddit.upload(image['image_path'])} for image in images]
+        return self._submission(self.reddit.post('/api/submit_gallery_post.json', {'title': title, 'items': str(items)}))
+
+    def submit_video(self, title, video_path, videogif=False, thumbnail_path=None, flair_id=None):
+        video_id = self.reddit.upload(video_path)
+        thumbnail_id = self.reddit.upload(thumbnail_path)
+        return self._submission(self.reddit.post('/api/submit', {'title': title, 'kind': 'video', 'url': video_id, 'video_poster_url': thumbnail_id}))
+
+class FakeThing:
+    def __init__(self, reddit, kind, thing_id):
+        self.reddit = reddit
+        self.id = thing_id
+        self.fullname = '{}_{}'.format(kind, thing_id)
+        self.mod = FakeModeration(self)
+
+    def __str__(self):
+        return self.id
+
+    def reply(self, body):
+        data = self.reddit.post('/api/comment', {'thing_id': self.fullname, 'text': body})
+        return FakeThing(self.reddit, 't1', data['json']['data']['things'][0]['data']['id'])
+
+class FakeModeration:
+    def __init__(self, thing):
+        self.thing = thing
+
+    def distinguish(self, how='yes', sticky=False):
+        self.thing.reddit.post('/api/distinguish', {'id': self.thing.fullname, 'how': how, 'sticky': sticky})
+
+    def approve(self):
+        self.thing.reddit.post('/api/approve', {'id': self.thing.fullname})
@@ -0,0 +1,32 @@
+import os
+import sys
+import types
+import pathlib
+
+# How the benchmarks load the function package. Standard library only, so bench.startup can time a cold
+# import of the bot without anything else already in sys.modules.
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+FUNCTION_DIR = ROOT / 'sakuraitweetbot-function'
+PACKAGE = 'sakuraitweetbot_function'
+
+ENVIRONMENT = {'TEST_MODE': 'False',
+               'SLEEP_MODE': 'True',
+               'IMGUR_ACCESS_TOKEN': 'bench',
+               'IMGUR_ALBUM_ID': 'benchalbum',
+               'AZURE_TRANSLATOR_API_KEY': 'bench',
+               'AZURE_REGION': 'bench',
+               'TWITTER_CONSUMER_KEY': 'bench',
+               'TWITTER_CONSUMER_SECRET': 'bench',
+               'REDDIT_CLIENT_ID': 'bench',
+               'REDDIT_CLIENT_SECRET': 'bench',
+               'REDDIT_USER_AGENT': 'bench',
+               'REDDIT_USERNAME': 'bench',
+               'REDDIT_PASSWORD': 'bench'}
+
+def install_package(data_dir):
+    # Register the function package without running its azure.functions entry point
+    os.environ.update(ENVIRONMENT, SAKURAI_DATA_DIR=str(data_dir))
+    package = types.ModuleType(PACKAGE)
+    package.__path__ = [str(FUNCTION_DIR)]
+    sys.modules[PACKAGE] = package
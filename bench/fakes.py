@@ -0,0 +1,230 @@
+import io
+import json
+import time
+import random
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from PIL import Image
+
+SCREEN_NAME = 'Sora_Sakurai'
+USER_ID = 1000
+TWITTER_DATE_FORMAT = '%a %b %d %H:%M:%S +0000 %Y'
+REDDIT_QUOTA = 600
+REDDIT_WINDOW = 600
+
+# Local stand-in for every service the bot talks to, all on one port:
+#   /twitter/...    bearer token, timeline and statuses/lookup (JSON shaped like v1.1 extended tweets)
+#   /media/...      the pbs.twimg.com images
+#   /reddit/...     access token, submit, media upload lease + upload target, gallery, video, comment, distinguish, approve
+#   /imgur/3/...    image upload, album images/add/update/cover
+#   /translate      Azure Translator v3
+# Latency and failure rate can be set per service; every request's bytes in/out are counted per service.
+
+class FakeServices:
+    def __init__(self, latency=None, failure_rate=None, image_size=2048, seed=0):
+        self.latency = latency or {} # service -> seconds added to each request
+        self.failure_rate = failure_rate or {} # service -> probability of a 503 (429 with Retry-After for imgur)
+                                               # reddit_ratelimit -> probability of a RATELIMIT error on a reddit post/comment
+        self.image_size = image_size
+        self.random = random.Random(seed)
+        self.tweets = [] # newest first
+        self.album = []
+        self.reddit_quota = {'window_start': time.time(), 'used': 0}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self._image = None
+        self._next_id = 1
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def new_id(self):
+        with self.lock:
+            self._next_id += 1
+            return self._next_id
+
+    def image_bytes(self):
+        # One noisy JPEG (compresses about as badly as a real screenshot) shared by every media url
+        if self._image is None:
+            size = (self.image_size, self.image_size)
+            bands = [Image.effect_noise(size, 48) for _ in range(3)]
+            buffer = io.BytesIO()
+            Image.merge('RGB', bands).save(buffer, 'JPEG', quality=90)
+            self._image = buffer.getvalue()
+        return self._image
+
+    def count(self, service, bytes_in, bytes_out):
+        with self.lock:
+            counter = self.counters.setdefault(service, {'requests': 0, 'bytes_in': 0, 'bytes_out': 0})
+            counter['requests'] += 1
+            counter['bytes_in'] += bytes_in
+            counter['bytes_out'] += bytes_out
+
+    # Timeline fixtures
+
+    def add_tweet(self, created_at, num_media=0, text='', in_reply_to=None):
+        tweet_id = self.new_id() * 1000 # strictly increasing like snowflake ids
+        media = [{'media_url_https': '{}/media/{}-{}.jpg'.format(self.url, tweet_id, idx), 'type': 'photo'} for idx in range(num_media)]
+        full_text = text + (' https://t.co/{}'.format(tweet_id) if media else '')
+        prefix = '@{} '.format(SCREEN_NAME) if in_reply_to else ''
+        tweet = {'id': tweet_id,
+                 'created_at': created_at.strftime(TWITTER_DATE_FORMAT),
+                 'full_text': prefix + full_text,
+                 'display_text_range': [len(prefix), len(prefix) + len(text)],
+                 'in_reply_to_status_id': in_reply_to,
+                 'in_reply_to_user_id': USER_ID if in_reply_to else None,
+                 'user': {'id': USER_ID, 'screen_name': SCREEN_NAME},
+                 'entities': {'media': media} if media else {},
+                 'extended_entities': {'media': media} if media else {}}
+        self.tweets.insert(0, tweet)
+        return tweet_id
+
+    def add_thread(self, created_at, media_per_tweet, text='今日の一枚'):
+        # First entry is the root, the rest are self-replies (0 media = text-only reply)
+        parent = None
+        for idx, num_media in enumerate(media_per_tweet):
+            parent = self.add_tweet(created_at + timedelta(minutes=idx), num_media, '{} {}'.format(text, idx + 1), parent)
+
+    # Routing
+
+    def route(self, method, path, query, body):
+        # Returns (service, status, headers, payload) where payload is bytes or a JSON-able object
+        if path.startswith('/twitter/'):
+            return ('twitter',) + self.twitter(path, query)
+        if path.startswith('/media/'):
+            return 'media', 200, {'Content-Type': 'image/jpeg'}, self.image_bytes()
+        if path.startswith('/reddit/'):
+            return ('reddit',) + self.reddit(method, path, body)
+        if path.startswith('/imgur/'):
+            return ('imgur',) + self.imgur(method, path, body)
+        if path.startswith('/translate'):
+            texts = json.loads(body.decode('utf-8') or '[]')
+            return 'translator', 200, {}, [{'translations': [{'text': 'EN: {}'.format(item['text']), 'to': 'en'}]} for item in texts]
+        return 'unknown', 404, {}, {'error': 'not found'}
+
+    def twitter(self, path, query):
+        if path.endswith('/oauth2/token'):
+            return 200, {}, {'token_type': 'bearer', 'access_token': 'bench-bearer'}
+        if path.endswith('/statuses/user_timeline.json'):
+            since_id = int(query.get('since_id', ['0'])[0])
+            max_id = int(query.get('max_id', [str(1 << 62)])[0])
+            count = int(query.get('count', ['20'])[0])
+            return 200, {}, [tweet for tweet in self.tweets if since_id < tweet['id'] <= max_id][:count]
+        if path.endswith('/statuses/lookup.json'):
+            ids = set(int(tweet_id) for tweet_id in query.get('id', [''])[0].split(',') if tweet_id)
+            return 200, {}, [tweet for tweet in self.tweets if tweet['id'] in ids]
+        return 404, {}, {'errors': [{'message': 'not found'}]}
+
+    def reddit_ratelimit_headers(self):
+        # Like reddit's OAuth API: 600 requests per 10 minute window
+        with self.lock:
+            now = time.time()
+            if now - self.reddit_quota['window_start'] >= REDDIT_WINDOW:
+                self.reddit_quota = {'window_start': now, 'used': 0}
+            self.reddit_quota['used'] += 1
+            return {'X-Ratelimit-Used': str(self.reddit_quota['used']),
+                    'X-Ratelimit-Remaining': str(max(0, REDDIT_QUOTA - self.reddit_quota['used'])),
+                    'X-Ratelimit-Reset': str(int(REDDIT_WINDOW - (now - self.reddit_quota['window_start'])))}
+
+    def reddit(self, method, path, body):
+        thing_id = '{:x}'.format(self.new_id())
+        if path.endswith('/api/v1/access_token'):
+            return 200, {}, {'access_token': 'bench-{}'.format(thing_id), 'token_type': 'bearer', 'expires_in': 3600, 'scope': '*'}
+        if path.endswith('/upload'):
+            return 201, {}, b'' # the media upload target is S3, not the API
+        headers = self.reddit_ratelimit_headers()
+        if path.endswith(('/api/submit', '/api/submit_gallery_post.json', '/api/comment')) and self.random.random() < self.failure_rate.get('reddit_ratelimit', 0):
+            return 200, headers, {'json': {'errors': [['RATELIMIT', "Looks like you've been doing that a lot. Take a break for 1 second before trying again.", 'ratelimit']]}}
+        if path.endswith('/api/media/asset.json'):
+            return 200, headers, {'args': {'action': '{}/reddit/upload'.format(self.url), 'fields': []},
+                                  'asset': {'asset_id': thing_id}}
+        if path.endswith('/api/comment'):
+            return 200, headers, {'json': {'errors': [], 'data': {'things': [{'kind': 't1', 'data': {'id': thing_id, 'name': 't1_' + thing_id}}]}}}
+        if path.endswith(('/api/distinguish', '/api/approve')):
+            return 200, headers, {'json': {'errors': []}}
+        # submit, submit_gallery_post.json, video
+        return 200, headers, {'json': {'errors': [], 'data': {'id': thing_id, 'name': 't3_' + thing_id,
+                                                         'url': 'https://www.reddit.com/r/test/comments/{}/'.format(thing_id)}}}
+
+    def imgur(self, method, path, body):
+        parts = [part for part in path.split('/') if part] # ['imgur', '3', 'image'] / ['imgur', '3', 'album', id, 'images']
+        if parts[2] == 'image' and method == 'POST':
+            if self.random.random() < self.failure_rate.get('imgur', 0):
+                return 429, {'Retry-After': '0'}, {'success': False, 'status': 429, 'data': {'error': 'rate limited'}}
+            image_id = 'img{}'.format(self.new_id())
+            return 200, {'X-RateLimit-UserRemaining': '1000'}, {'success': True, 'status': 200,
+                                                                 'data': {'id': image_id, 'link': '{}/i/{}.jpg'.format(self.url, image_id)}}
+        if parts[2] == 'album':
+            if method == 'GET' and parts[-1] == 'images':
+                return 200, {}, {'success': True, 'data': [{'id': image_id} for image_id in self.album]}
+            if method == 'POST' and parts[-1] == 'add':
+                self.album.extend(parse_qs(body.decode('utf-8')).get('ids[]', []))
+                return 200, {}, {'success': True, 'data': True}
+            if method == 'POST' and len(parts) > 3:
+                ids = parse_qs(body.decode('utf-8')).get('ids[]', [])
+                if ids:
+                    self.album = ids
+                return 200, {}, {'success': True, 'data': True}
+            if method == 'PUT':
+                return 200, {}, {'success': True, 'data': True}
+            return 200, {}, {'success': True, 'data': {'id': 'album{}'.format(self.new_id())}}
+        return 404, {}, {'success': False}
+
+    def _handler_class(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1' # keep-alive, so the client's connection pooling is exercised
+            disable_nagle_algorithm = True # headers and body are separate writes, avoid delayed-ACK stalls
+
+            def log_message(self, format, *args):
+                pass
+
+            def handle_one(self, method):
+                parts = urlsplit(self.path)
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0) or 0))
+                service, status, headers, payload = services.route(method, parts.path, parse_qs(parts.query), body)
+
+                time.sleep(services.latency.get(service, 0))
+                if status < 400 and service not in ('media', 'imgur') and services.random.random() < services.failure_rate.get(service, 0):
+                    status, headers, payload = 503, {}, {'error': 'injected failure'}
+
+                data = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(data)))
+                self.send_header('Content-Type', headers.pop('Content-Type', 'application/json'))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+                services.count(service, len(body), len(data))
+
+            def do_GET(self):
+                self.handle_one('GET')
+
+            def do_POST(self):
+                self.handle_one('POST')
+
+            def do_PUT(self):
+                self.handle_one('PUT')
+
+        return Handler
+
+def parse_twitter_date(value):
+    return datetime.strptime(value, TWITTER_DATE_FORMAT)
@@ -0,0 +1,182 @@
+import os
+import sys
+import json
+import time
+import logging
+import pathlib
+import argparse
+import resource
+import importlib
+import subprocess
+import tempfile
+from datetime import datetime, timedelta
+
+from .fakes import FakeServices
+from .adapters import FakeTweepy, FakePraw
+from .env import ROOT, PACKAGE, install_package
+
+# End-to-end benchmark of sakuraitweetbot.main() against local stand-ins (see fakes.py).
+# Every scenario runs in its own process so peak RSS and caches are per scenario.
+#
+#   python -m bench.run                                  run all scenarios
+#   python -m bench.run single gallery4 --latency 0.05   some scenarios, 50ms per request
+#   python -m bench.run --fail imgur=0.2 --fail translator=0.1
+#   python -m bench.run --fail reddit_ratelimit=0.3       RATELIMIT errors on reddit posts/comments
+#   python -m bench.run --save-baseline                  write bench/baseline.json
+#   python -m bench.run --compare                        diff against bench/baseline.json
+
+BASELINE_PATH = pathlib.Path(__file__).resolve().parent / 'baseline.json'
+
+# threads: media count per tweet of each thread (first is the root, 0 = text-only self-reply)
+# mode: how main() is invoked, incremental (timer run from the cursor), custom (CUSTOM_TWEET_IDS) or range (backfill)
+SCENARIOS = {
+    'single': {'threads': [[1]], 'mode': 'incremental'},
+    'gallery4': {'threads': [[4]], 'mode': 'incremental'},
+    'long_thread': {'threads': [[4, 0, 2, 0, 1, 1, 0, 4, 0, 2]], 'mode': 'incremental'},
+    'gallery4_x10_custom': {'threads': [[4]] * 10, 'mode': 'custom'},
+    'backfill100': {'threads': [[1]] * 100, 'mode': 'range'},
+}
+
+class ErrorCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+def load_bot(base_url, data_dir):
+    install_package(data_dir)
+
+    # Modules read config at import time, so point it at the fakes before importing the bot
+    settings = importlib.import_module(PACKAGE + '.settings')
+    settings.config['Imgur']['UPLOAD_IMAGE_API'] = base_url + '/imgur/3/image'
+    settings.config['Imgur']['CREATE_ALBUM_API'] = base_url + '/imgur/3/album'
+    settings.config['Azure']['TRANSLATE_ENDPOINT'] = base_url + '/translate'
+    settings.config['Media']['CACHE_DIR'] = str(pathlib.Path(data_dir) / 'media_cache')
+    settings.config['Media']['SCRATCH_DIR'] = str(pathlib.Path(data_dir) / 'scratch')
+
+    bot = importlib.import_module(PACKAGE + '.sakuraitweetbot')
+    use_fake_clients(base_url)
+    return bot
+
+def use_fake_clients(base_url):
+    # Build the bot's twitter/reddit clients from the adapters instead of tweepy/praw
+    clients = sys.modules[PACKAGE + '.clients']
+    tweepy = FakeTweepy(base_url)
+    praw = FakePraw(base_url)
+    clients.set_factory('twitter', lambda: tweepy.API(tweepy.AppAuthHandler(os.environ['TWITTER_CONSUMER_KEY'], os.environ['TWITTER_CONSUMER_SECRET'])))
+    reddit_writer = sys.modules[PACKAGE + '.reddit_writer']
+    clients.set_factory('reddit', lambda: praw.Reddit(client_id=os.environ['REDDIT_CLIENT_ID'], requestor_kwargs={'session': reddit_writer.governed_session()}))
+
+def run_child(name, args):
+    scenario = SCENARIOS[name]
+    logging.basicConfig(level=getattr(logging, args.log_level), format='%(asctime)s %(levelname)s (%(name)s): %(message)s')
+    errors = ErrorCounter()
+    logging.getLogger().addHandler(errors)
+
+    services = FakeServices(latency={service: args.latency for service in ('twitter', 'media', 'reddit', 'imgur', 'translator')},
+                            failure_rate=dict(args.fail),
+                            image_size=args.image_size).start()
+    data_dir = tempfile.mkdtemp(prefix='sakuraitweetbot-bench-')
+
+    # Oldest thread first; incremental runs bootstrap from the last day, backfill threads are one per day
+    now = datetime.utcnow()
+    num_threads = len(scenario['threads'])
+    for idx, media_per_tweet in enumerate(scenario['threads']):
+        if scenario['mode'] == 'range':
+            created_at = now - timedelta(days=num_threads - idx)
+        else:
+            created_at = now - timedelta(minutes=20 * (num_threads - idx))
+        services.add_thread(created_at, media_per_tweet)
+    services.image_bytes() # generate the fixture image before timing
+
+    bot = load_bot(services.url, data_dir)
+    tracing = sys.modules[PACKAGE + '.tracing']
+    http_client = sys.modules[PACKAGE + '.http_client']
+
+    start = time.perf_counter()
+    if scenario['mode'] == 'custom':
+        bot.main(set(tweet['id'] for tweet in services.tweets))
+    elif scenario['mode'] == 'range':
+        bot.main(since=now - timedelta(days=len(scenario['threads']) + 1), until=now)
+    else:
+        bot.main()
+    wall_time = time.perf_counter() - start
+
+    services.stop()
+    return {'scenario': name,
+            'wall_time': wall_time,
+            'errors': errors.count,
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, # KiB on Linux
+            'bytes_transferred': sum(counter['bytes_in'] + counter['bytes_out'] for counter in services.counters.values()),
+            'services': services.counters,
+            'spans': tracing.snapshot(),
+            'http': http_client.metrics_snapshot(),
+            'options': {'latency': args.latency, 'fail': dict(args.fail), 'image_size': args.image_size}}
+
+def run_scenario(name, args):
+    command = [sys.executable, '-m', 'bench.run', '--child', name,
+               '--latency', str(args.latency), '--image-size', str(args.image_size), '--log-level', args.log_level]
+    for service, rate in args.fail:
+        command += ['--fail', '{}={}'.format(service, rate)]
+    output = subprocess.run(command, cwd=str(ROOT), stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def print_report(reports, baseline=None):
+    print('{:<22} {:>10} {:>10} {:>12} {:>7}'.format('scenario', 'wall (s)', 'rss (MB)', 'bytes', 'errors'))
+    for report in reports:
+        line = '{:<22} {:>10.3f} {:>10.1f} {:>12} {:>7}'.format(report['scenario'], report['wall_time'], report['peak_rss_mb'], report['bytes_transferred'], report['errors'])
+        if baseline and report['scenario'] in baseline:
+            before = baseline[report['scenario']]
+            line += '   wall {:+.1%}  rss {:+.1%}  bytes {:+.1%}'.format(
+                report['wall_time'] / before['wall_time'] - 1,
+                report['peak_rss_mb'] / before['peak_rss_mb'] - 1,
+                report['bytes_transferred'] / max(1, before['bytes_transferred']) - 1)
+        print(line)
+        for name, span in sorted(report['spans'].items(), key=lambda item: -item[1]['total']):
+            print('    {:<26} {:>4}x  total {:>8.3f}s  max {:>8.3f}s'.format(name, span['count'], span['total'], span['max']))
+
+def parse_fail(value):
+    service, rate = value.split('=')
+    return service, float(rate)
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end benchmark of sakuraitweetbot.main() against local fake services.')
+    parser.add_argument('scenarios', nargs='*', help='any of {} (default: all)'.format(', '.join(SCENARIOS)))
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to every fake request')
+    parser.add_argument('--fail', type=parse_fail, action='append', default=[], metavar='SERVICE=RATE', help='failure rate for twitter/reddit/imgur/translator, or reddit_ratelimit')
+    parser.add_argument('--image-size', type=int, default=2048, help='width/height of the served images')
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--save-baseline', action='store_true', help='write results to {}'.format(BASELINE_PATH.name))
+    parser.add_argument('--compare', action='store_true', help='compare against {}'.format(BASELINE_PATH.name))
+    parser.add_argument('--json', action='store_true', help='print the full reports as JSON')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args)))
+        return
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error('unknown scenarios: {}'.format(', '.join(unknown)))
+
+    reports = [run_scenario(name, args) for name in (args.scenarios or list(SCENARIOS))]
+
+    baseline = None
+    if args.compare:
+        with open(BASELINE_PATH) as f:
+            baseline = {report['scenario']: report for report in json.load(f)}
+    if args.json:
+        print(json.dumps(reports, indent=2, sort_keys=True))
+    else:
+        print_report(reports, baseline)
+
+    if args.save_baseline:
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(reports, f, indent=2, sort_keys=True)
+        print('Saved baseline to {}'.format(BASELINE_PATH))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import sys
+import json
+import time
+import argparse
+import importlib
+import statistics
+import subprocess
+import tempfile
+
+from .env import ROOT, PACKAGE, install_package
+
+# Cold start costs of the function, the part a timer invocation pays before doing any work:
+#   import    median time to import the bot in a fresh interpreter, and which heavy modules that pulls in;
+#             --eager also times importing them up front (what the bot did before they were made lazy)
+#   warm      three runs of main() in one process against the fake services (one new tweet each):
+#             first run, second run reusing the clients, third run after invalidating them
+#
+#   python -m bench.startup
+#   python -m bench.startup import --runs 20 --eager
+#   python -m bench.startup warm --latency 0.1
+
+HEAVY_MODULES = ['PIL.Image', 'ffmpeg', 'praw', 'tweepy']
+
+def import_child(eager):
+    install_package(tempfile.mkdtemp(prefix='sakuraitweetbot-startup-'))
+    start = time.perf_counter()
+    if eager:
+        for name in HEAVY_MODULES:
+            importlib.import_module(name)
+    importlib.import_module(PACKAGE + '.sakuraitweetbot')
+    import_time = time.perf_counter() - start
+    return {'import_time': import_time,
+            'modules': len(sys.modules),
+            'heavy_loaded': [name for name in HEAVY_MODULES if name in sys.modules]}
+
+def measure_import(runs, eager):
+    command = [sys.executable, '-m', 'bench.startup', '--import-child'] + (['--eager'] if eager else [])
+    reports = [json.loads(subprocess.run(command, cwd=str(ROOT), stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout)
+               for _ in range(runs)]
+    return {'median': statistics.median(report['import_time'] for report in reports),
+            'min': min(report['import_time'] for report in reports),
+            'modules': reports[-1]['modules'],
+            'heavy_loaded': reports[-1]['heavy_loaded']}
+
+def measure_warm(latency):
+    from datetime import datetime, timedelta
+    from .fakes import FakeServices
+    from .run import load_bot
+
+    services = FakeServices(latency={service: latency for service in ('twitter', 'media', 'reddit', 'imgur', 'translator')}).start()
+    services.image_bytes() # generate the fixture image before timing
+    bot = load_bot(services.url, tempfile.mkdtemp(prefix='sakuraitweetbot-startup-'))
+    clients = sys.modules[PACKAGE + '.clients']
+    ratelimit = sys.modules[PACKAGE + '.ratelimit']
+    reddit_writer = sys.modules[PACKAGE + '.reddit_writer']
+    reddit_writer.governor = ratelimit.RateGovernor(rate=1000, capacity=1000) # back-to-back runs would otherwise wait on reddit's pacing
+
+    now = datetime.utcnow()
+    timings = []
+    for idx, label in enumerate(['first run', 'warm run', 'invalidated']):
+        if label == 'invalidated':
+            clients.invalidate()
+        services.add_thread(now - timedelta(minutes=30 - idx * 10), [1])
+        start = time.perf_counter()
+        bot.main()
+        timings.append((label, time.perf_counter() - start))
+
+    services.stop()
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold start benchmark of sakuraitweetbot: import time and client reuse.')
+    parser.add_argument('measurements', nargs='*', help='import and/or warm (default: both)')
+    parser.add_argument('--runs', type=int, default=10, help='fresh interpreters per import measurement')
+    parser.add_argument('--eager', action='store_true', help='also time importing {} up front'.format(', '.join(HEAVY_MODULES)))
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added to every fake request')
+    parser.add_argument('--import-child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.import_child:
+        print(json.dumps(import_child(args.eager)))
+        return
+
+    unknown = [name for name in args.measurements if name not in ('import', 'warm')]
+    if unknown:
+        parser.error('unknown measurements: {}'.format(', '.join(unknown)))
+    measurements = args.measurements or ['import', 'warm']
+
+    if 'import' in measurements:
+        print('{:<10} {:>10} {:>10} {:>8}  {}'.format('import', 'median (s)', 'min (s)', 'modules', 'heavy modules loaded'))
+        for eager in ([False, True] if args.eager else [False]):
+            report = measure_import(args.runs, eager)
+            print('{:<10} {:>10.3f} {:>10.3f} {:>8}  {}'.format('eager' if eager else 'lazy', report['median'], report['min'], report['modules'], ', '.join(report['heavy_loaded']) or '-'))
+
+    if 'warm' in measurements:
+        print('{:<12} {:>10}'.format('main()', 'wall (s)'))
+        for label, wall_time in measure_warm(args.latency):
+            print('{:<12} {:>10.3f}'.format(label, wall_time))
+
+if __name__ == '__main__':
+    main()
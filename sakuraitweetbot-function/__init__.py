@@ -6,17 +6,17 @@ import logging
 import azure.functions as func
 
 from . import sakuraitweetbot
+from . import logqueue
 
 def main(mytimer: func.TimerRequest) -> None:
-    # Logger setup
-    logging.basicConfig(
-        filename='/logs/{}{}.log'.format(datetime.today().strftime("%Y-%m-%d"),'_test' if sakuraitweetbot.TEST_MODE else ''),
-        filemode='w',
-        format='%(asctime)s %(levelname)s (%(name)s): %(message)s',
-        datefmt='%m/%d/%Y %I:%M:%S %p',
-        level=logging.DEBUG
-    )
-
+    # Logger setup; records are formatted and written by a background thread (see logqueue)
+    logqueue.start('/logs/{}{}.log'.format(datetime.today().strftime("%Y-%m-%d"),'_test' if sakuraitweetbot.TEST_MODE else ''))
+    try:
+        run(mytimer)
+    finally:
+        logqueue.stop()
+
+def run(mytimer: func.TimerRequest) -> None:
     logger = logging.getLogger(__name__)
 
     # Time check
@@ -26,15 +26,19 @@ def main(mytimer: func.TimerRequest) -> None:
     if mytimer.past_due:
         logger.info('The timer is past due!')
 
-    logger.info('Python timer trigger function ran at {} (UTC)'.format(utc_timestamp))
+    logger.info('Python timer trigger function ran at %s (UTC)', utc_timestamp)
 
     # Run sakuraitweetbot main
 
     custom_tweet_ids = os.environ.get('CUSTOM_TWEET_IDS') # Pass custom tweet ids as env variable string (sep==';')
+    backfill_since = os.environ.get('BACKFILL_SINCE') # Or a backfill date range as env variables (format=YYYY-MM-DD, UTC, until is exclusive)
+    backfill_until = os.environ.get('BACKFILL_UNTIL')
 
     if custom_tweet_ids:
         custom_tweet_ids = set(int(tweet_id) for tweet_id in custom_tweet_ids.split(';'))
         sakuraitweetbot.main(custom_tweet_ids)
+    elif backfill_since or backfill_until:
+        sakuraitweetbot.main(since=sakuraitweetbot.parse_date(backfill_since), until=sakuraitweetbot.parse_date(backfill_until))
     else: # custom_tweet_ids == None or custom_tweet_ids == ''
         sakuraitweetbot.main()
 
@@ -0,0 +1,20 @@
+import sys
+import types
+import pathlib
+
+# Manual runs outside of Azure Functions, from the repository root (same environment variables as the Function App):
+#   python sakuraitweetbot-function
+#   CUSTOM_TWEET_IDS='1580002;1590002' python sakuraitweetbot-function
+#   BACKFILL_SINCE=2022-10-01 BACKFILL_UNTIL=2022-10-08 python sakuraitweetbot-function
+# The bot's modules import each other relatively, so they are loaded as a package here, without the
+# azure.functions entry point in __init__.py (the same way bench/env.py loads them)
+
+PACKAGE = 'sakuraitweetbot_function'
+
+package = types.ModuleType(PACKAGE)
+package.__path__ = [str(pathlib.Path(__file__).resolve().parent)]
+sys.modules[PACKAGE] = package
+
+from sakuraitweetbot_function import sakuraitweetbot
+
+sakuraitweetbot.main_from_env()
@@ -0,0 +1,88 @@
+import os
+import json
+import time
+import logging
+
+from .settings import config, DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+INDEX_PATH = DATA_DIR / config['Storage']['ALBUM_INDEX']
+RECONCILE_DAYS = config.getfloat('Imgur', 'ALBUM_RECONCILE_DAYS')
+
+class AlbumError(Exception):
+    pass
+
+# Index format: {'album_id': imgur album hash, 'image_ids': ids known to be in the album, newest first, 'cover': cover image id,
+#                'reconciled_at': unix time of the last full read of the album, 'dirty': True while a write is in flight}
+def load_index(album_id):
+    try:
+        with open(INDEX_PATH) as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        return None
+    if index['album_id'] != album_id:
+        logger.info('Album index is for album %s, not %s.', index['album_id'], album_id)
+        return None
+    logger.info('Loaded album index: %s images, reconciled %s.', len(index['image_ids']), time.ctime(index['reconciled_at']))
+    return index
+
+def save_index(index):
+    INDEX_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = INDEX_PATH.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, INDEX_PATH) # atomic, a crash never leaves a half-written index
+
+def is_stale(index):
+    # A write that never got confirmed (crash, failed request) or an old index means the remote album may have drifted
+    if index is None:
+        return True
+    if index['dirty']:
+        logger.info('Album index has an unconfirmed write.')
+        return True
+    return time.time() - index['reconciled_at'] > RECONCILE_DAYS * 24 * 60 * 60
+
+def album_order(index, image_ids_in_album):
+    # Newest first, as the album has always been: the order the index knows, then anything only the album has
+    if index is None:
+        return list(image_ids_in_album)
+    in_album = set(image_ids_in_album)
+    known = set(index['image_ids'])
+    return [image_id for image_id in index['image_ids'] if image_id in in_album] + [image_id for image_id in image_ids_in_album if image_id not in known]
+
+def update(album_id, image_ids, fetch_album_ids, set_album):
+    # Put image_ids at the front of the album and make image_ids[0] its cover
+    # fetch_album_ids() -> ids currently in the album (in album order), set_album(ids, cover) replaces the album's ids
+    # and cover; both do the HTTP
+    # The album is newest first, and imgur can only append or replace, so every change is one write of the full id list
+    # the index already has: no read of the album, and it is never out of order. The album is only read back when the
+    # index is missing, has an unconfirmed write or is older than RECONCILE_DAYS, and only rewritten then if it differs
+    index = load_index(album_id)
+    image_ids_in_album = None
+    if is_stale(index):
+        image_ids_in_album = fetch_album_ids()
+        logger.info('Reconciled album index with %s images from album %s.', len(image_ids_in_album), album_id)
+        index = {'album_id': album_id, 'image_ids': album_order(index, image_ids_in_album), 'cover': index['cover'] if index else None,
+                 'reconciled_at': time.time(), 'dirty': False}
+
+    new_ids = set(image_ids) - set(index['image_ids'])
+    ordered_ids = list(image_ids) + [image_id for image_id in index['image_ids'] if image_id not in set(image_ids)]
+    cover = image_ids[0] if image_ids else index['cover']
+    drifted = image_ids_in_album is not None and ordered_ids != image_ids_in_album
+    if ordered_ids == index['image_ids'] and cover == index['cover'] and not drifted:
+        logger.info('Album %s already up to date.', album_id)
+        save_index(index)
+        return index
+
+    index['dirty'] = True
+    save_index(index)
+
+    set_album(ordered_ids, cover)
+    logger.info('Wrote album %s newest first (%s images, %s new).', album_id, len(ordered_ids), len(new_ids))
+    index['image_ids'] = ordered_ids
+    index['cover'] = cover
+
+    index['dirty'] = False
+    save_index(index)
+    return index
@@ -0,0 +1,56 @@
+import logging
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+from .settings import config
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = config.getint('Batch', 'MAX_WORKERS')
+
+def run_jobs(jobs, job_fn, max_workers=MAX_WORKERS):
+    # Runs job_fn(job) for every job through a bounded worker pool; a failing job is logged and does not stop the others
+    # Returns [(job, result, exception)] in the order of jobs
+    def run(job):
+        try:
+            return job, job_fn(job), None
+        except Exception as ex:
+            logger.info('Job failed: %s', job)
+            logger.exception(ex)
+            return job, None, ex
+
+    if not jobs:
+        return []
+    workers = max(1, min(max_workers, len(jobs)))
+    logger.info('Running %s jobs with %s workers.', len(jobs), workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(run, jobs))
+    logger.info('Finished %s jobs, %s failed.', len(results), sum(1 for _, _, ex in results if ex is not None))
+    return results
+
+class Turnstile:
+    # Lets jobs through one section in job order (e.g. reddit submits, so posts go up oldest first however the jobs
+    # race): the job with key i enters once every job before it has passed, or given up its turn with done()
+    def __init__(self, keys):
+        self.position = {key: idx for idx, key in enumerate(keys)}
+        self.next = 0
+        self.passed = set()
+        self.cond = threading.Condition()
+
+    @contextlib.contextmanager
+    def turn(self, key):
+        with self.cond:
+            self.cond.wait_for(lambda: self.next >= self.position[key])
+        try:
+            yield
+        finally:
+            self.done(key)
+
+    def done(self, key):
+        # Passes the turn on; safe to call again, and for a job that never gets to the section
+        with self.cond:
+            self.passed.add(self.position[key])
+            while self.next in self.passed:
+                self.next += 1
+            self.cond.notify_all()
@@ -0,0 +1,74 @@
+import os
+import logging
+import threading
+
+from .settings import TEST_MODE
+from . import reddit_writer
+
+logger = logging.getLogger(__name__)
+
+# Authenticated API clients, built once per worker process and reused by every invocation while the worker
+# stays warm. tweepy's app-only bearer token does not expire; praw's script authorizer refreshes its own
+# OAuth token when it expires. A client is only rebuilt after invalidate(), e.g. on a 401.
+# praw/tweepy are imported inside the factories so importing the bot stays cheap on a cold start.
+
+_factories = {}
+_clients = {}
+_guard = threading.Lock()
+
+def factory(name):
+    def decorator(fn):
+        _factories[name] = fn
+        return fn
+    return decorator
+
+@factory('twitter')
+def _twitter():
+    import tweepy
+    auth = tweepy.AppAuthHandler(consumer_key=os.environ['TWITTER_CONSUMER_KEY'],
+                                 consumer_secret=os.environ['TWITTER_CONSUMER_SECRET']) # fetches the bearer token
+    logger.info('Twitter auth complete.')
+    return tweepy.API(auth)
+
+@factory('reddit')
+def _reddit():
+    import praw
+    reddit = praw.Reddit(client_id=os.environ['REDDIT_CLIENT_ID'],
+                         client_secret=os.environ['REDDIT_CLIENT_SECRET'],
+                         user_agent=os.environ['REDDIT_USER_AGENT'],
+                         username=os.environ['REDDIT_USERNAME_TEST' if TEST_MODE else 'REDDIT_USERNAME'],
+                         password=os.environ['REDDIT_PASSWORD'],
+                         requestor_kwargs={'session': reddit_writer.governed_session()}) # rate limit headers feed the write governor
+    logger.info('Reddit auth complete.')
+    return reddit
+
+def get(name):
+    with _guard:
+        if name not in _clients:
+            _clients[name] = _factories[name]()
+        else:
+            logger.info('Reusing %s client.', name)
+        return _clients[name]
+
+def twitter_api():
+    return get('twitter')
+
+def reddit():
+    return get('reddit')
+
+def set_factory(name, fn):
+    # Swap how a client is built (e.g. for the benchmark's fake services); drops the cached one
+    with _guard:
+        _factories[name] = fn
+        _clients.pop(name, None)
+
+def invalidate(*names):
+    with _guard:
+        for name in names or list(_clients):
+            if _clients.pop(name, None) is not None:
+                logger.info('Invalidated %s client.', name)
+
+def is_auth_error(ex):
+    # tweepy.TweepError and prawcore's ResponseException both carry the failed response
+    response = getattr(ex, 'response', None)
+    return getattr(response, 'status_code', None) in (401, 403)
@@ -0,0 +1,94 @@
+import os
+import hashlib
+import pathlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .settings import config
+from . import http_client
+from . import tracing
+
+logger = logging.getLogger(__name__)
+
+# Persistent on-disk media cache shared across runs (reruns, CUSTOM_TWEET_IDS, retries); each job gets its own
+# workspace Media for a url, a cache hit is linked into the workspace, a miss is downloaded into memory and written through
+CACHE_DIR = pathlib.Path(config['Media']['CACHE_DIR'])
+CACHE_MAX_BYTES = config.getint('Media', 'CACHE_MAX_BYTES')
+DOWNLOAD_WORKERS = config.getint('Media', 'DOWNLOAD_WORKERS')
+CHUNK_SIZE = config.getint('Media', 'CHUNK_SIZE')
+
+# One lock per cache key so concurrent callers asking for the same url download it only once
+_locks = {}
+_locks_guard = threading.Lock()
+
+def cache_key(media_url):
+    return hashlib.sha256(media_url.encode('utf-8')).hexdigest()
+
+def cache_path(media_url):
+    return CACHE_DIR / '{}.jpg'.format(cache_key(media_url))
+
+def _lock_for(key):
+    with _locks_guard:
+        return _locks.setdefault(key, threading.Lock())
+
+def download_media(media_url, scratch, name):
+    image_fp = cache_path(media_url)
+    with _lock_for(image_fp.stem):
+        try:
+            media = scratch.adopt(name, image_fp)
+            os.utime(image_fp) # bump mtime so eviction treats it as recently used
+            logger.info('Cache hit for %s (%s).', media_url, image_fp)
+            return media
+        except FileNotFoundError:
+            pass
+
+        # Stream into a workspace Media: kept in memory when it fits the run's budget, spilled to scratch otherwise
+        media = scratch.new_media(name)
+        with http_client.get(media_url, endpoint='twimg.media', stream=True) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                media.write(chunk)
+        media.close()
+        media.persist(image_fp) # atomic, readers never see a half-written cache entry
+        logger.info('Downloaded image %s: %r.', media_url, media)
+        return media
+
+@tracing.traced('download')
+def download_all(media_urls, scratch):
+    # Download every url in one parallel round, returns Media in the same order as media_urls (a repeated url is fetched once)
+    unique_urls = list(dict.fromkeys(media_urls))
+    workers = max(1, min(DOWNLOAD_WORKERS, len(unique_urls)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        names = ['image-{}.jpg'.format(idx) for idx in range(len(unique_urls))]
+        media = dict(zip(unique_urls, executor.map(download_media, unique_urls, [scratch] * len(unique_urls), names)))
+    evict(keep=set(cache_path(media_url) for media_url in unique_urls))
+    return [media[media_url] for media_url in media_urls]
+
+def evict(keep=()):
+    # Size-bounded LRU eviction by mtime; files in keep (the current batch) are never evicted.
+    # Workspaces hold hard links, so evicting an entry never pulls a file out from under a running job
+    if not CACHE_DIR.exists():
+        return
+    entries = []
+    total = 0
+    for fp in CACHE_DIR.glob('*.jpg'):
+        try:
+            st = fp.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime, st.st_size, fp))
+        total += st.st_size
+
+    for _, size, fp in sorted(entries, key=lambda entry: entry[0]):
+        if total <= CACHE_MAX_BYTES:
+            break
+        if fp in keep:
+            continue
+        try:
+            os.remove(fp)
+            total -= size
+            logger.info('Evicted cached image: %s', fp)
+        except Exception as ex:
+            logger.info('Error while evicting file: %s', fp)
+            logger.exception(ex)
@@ -0,0 +1,127 @@
+import os
+import time
+import bisect
+import logging
+import threading
+import functools
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .settings import config
+
+logger = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = config.getfloat('HTTP', 'CONNECT_TIMEOUT')
+READ_TIMEOUT = config.getfloat('HTTP', 'READ_TIMEOUT')
+POOL_SIZE = config.getint('HTTP', 'POOL_SIZE')
+MAX_RETRIES = config.getint('HTTP', 'MAX_RETRIES')
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket catches everything slower
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# One keep-alive session (connection pool) per scheme+host
+_sessions = {}
+_sessions_guard = threading.Lock()
+
+_metrics = {}
+_metrics_guard = threading.Lock()
+
+def _new_session():
+    # Only idempotent methods are retried here; POST retries are left to callers that know whether it is safe
+    retry = Retry(total=MAX_RETRIES, connect=MAX_RETRIES, read=MAX_RETRIES, status=MAX_RETRIES,
+                  backoff_factor=0.5, status_forcelist=(500, 502, 503, 504),
+                  allowed_methods=Retry.DEFAULT_ALLOWED_METHODS, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def session_for(url):
+    parts = urlsplit(url)
+    key = '{}://{}'.format(parts.scheme, parts.netloc)
+    with _sessions_guard:
+        if key not in _sessions:
+            _sessions[key] = _new_session()
+        return _sessions[key]
+
+@functools.lru_cache(maxsize=None)
+def imgur_headers():
+    return {'Authorization': 'Bearer ' + os.environ['IMGUR_ACCESS_TOKEN']}
+
+@functools.lru_cache(maxsize=None)
+def translator_headers():
+    return {'Ocp-Apim-Subscription-Key': os.environ['AZURE_TRANSLATOR_API_KEY'],
+            'Ocp-Apim-Subscription-Region': os.environ['AZURE_REGION'],
+            'Content-type': 'application/json'}
+
+def _body_size(body):
+    if body is None:
+        return 0
+    if isinstance(body, str):
+        return len(body.encode('utf-8'))
+    try:
+        return len(body)
+    except TypeError: # generators / file-like streaming bodies
+        return 0
+
+def _record(endpoint, elapsed, bytes_sent, bytes_received, error):
+    with _metrics_guard:
+        metric = _metrics.setdefault(endpoint, {'count': 0,
+                                                'errors': 0,
+                                                'bytes_sent': 0,
+                                                'bytes_received': 0,
+                                                'latency_total': 0.0,
+                                                'latency_buckets': [0] * (len(LATENCY_BUCKETS) + 1)})
+        metric['count'] += 1
+        metric['errors'] += 1 if error else 0
+        metric['bytes_sent'] += bytes_sent
+        metric['bytes_received'] += bytes_received
+        metric['latency_total'] += elapsed
+        metric['latency_buckets'][bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+
+def request(method, url, endpoint=None, **kwargs):
+    # endpoint is the metrics label, e.g. 'imgur.upload'; defaults to host + path
+    if endpoint is None:
+        parts = urlsplit(url)
+        endpoint = parts.netloc + parts.path
+    kwargs.setdefault('timeout', (CONNECT_TIMEOUT, READ_TIMEOUT))
+
+    start = time.perf_counter()
+    response = None
+    try:
+        response = session_for(url).request(method, url, **kwargs)
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        bytes_sent = _body_size(response.request.body) if response is not None else 0
+        if response is None:
+            bytes_received = 0
+        elif kwargs.get('stream'):
+            bytes_received = int(response.headers.get('Content-Length', 0))
+        else:
+            bytes_received = len(response.content)
+        _record(endpoint, elapsed, bytes_sent, bytes_received, response is None or response.status_code >= 400)
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+def put(url, **kwargs):
+    return request('PUT', url, **kwargs)
+
+def metrics_snapshot():
+    with _metrics_guard:
+        snapshot = {}
+        for endpoint, metric in _metrics.items():
+            snapshot[endpoint] = dict(metric, latency_buckets=dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ['inf'], metric['latency_buckets'])))
+        return snapshot
+
+def reset_metrics():
+    with _metrics_guard:
+        _metrics.clear()
@@ -0,0 +1,122 @@
+import io
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from .settings import config
+from .downloader import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Reddit and Imgur both reject still images above 20MB
+MAX_IMAGE_BYTES = config.getint('Media', 'MAX_IMAGE_BYTES')
+MAX_IMAGE_DIMENSION = config.getint('Media', 'MAX_IMAGE_DIMENSION')
+THUMBNAIL_SIZE = config.getint('Media', 'THUMBNAIL_SIZE')
+PROCESS_WORKERS = config.getint('Media', 'PROCESS_WORKERS')
+QUALITY_STEPS = (90, 85, 75, 65)
+
+def _encode(image, quality):
+    # Re-encoding without passing exif/icc/comments strips the metadata
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+def _shrink(source_fp):
+    # Runs in a worker process; downscale/recompress until the result fits MAX_IMAGE_BYTES, returns the encoded bytes
+    from PIL import Image
+    with Image.open(source_fp) as image:
+        width, height = image.size
+        scale = min(1.0, MAX_IMAGE_DIMENSION / max(width, height))
+        while True:
+            size = (max(1, int(width * scale)), max(1, int(height * scale)))
+            image.draft('RGB', size) # JPEG only: reduced decoding, a no-op once the image is loaded
+            resized = image.convert('RGB')
+            if resized.size != size:
+                resized = resized.resize(size, Image.LANCZOS)
+            for quality in QUALITY_STEPS:
+                data = _encode(resized, quality)
+                if len(data) <= MAX_IMAGE_BYTES:
+                    break
+            if len(data) <= MAX_IMAGE_BYTES:
+                break
+            scale *= 0.75
+    return data, size, quality
+
+def media_hash(media):
+    sha = hashlib.sha256()
+    with media.open() as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def prepared_path(source_hash):
+    return CACHE_DIR / '{}-prepared.jpg'.format(source_hash)
+
+def thumbnail_path(source_hash):
+    return CACHE_DIR / '{}-thumbnail.jpg'.format(source_hash)
+
+def needs_processing(media):
+    # Size only, so PIL is never loaded for the usual case; twitter serves at most 4096px, well under
+    # MAX_IMAGE_DIMENSION, which _shrink still enforces on anything it re-encodes
+    return media.size > MAX_IMAGE_BYTES
+
+def _cached(scratch, name, cached_fp):
+    # Workspace Media for a cache entry, None on a miss
+    try:
+        media = scratch.adopt(name, cached_fp)
+    except FileNotFoundError:
+        return None
+    logger.info('Using cached %s for %s.', cached_fp, name)
+    return media
+
+def prepare_all(media_list, scratch):
+    # Returns upload-ready Media in the same order; images already within limits are returned untouched
+    # (twitter strips their metadata already), the rest are shrunk across a process pool into new scratch Media,
+    # results are cached by source hash in the media cache
+    prepared = list(media_list)
+    todo = {} # source hash -> indexes of media_list with that content
+    for idx, media in enumerate(media_list):
+        if not needs_processing(media):
+            continue
+        source_hash = media_hash(media)
+        cached = _cached(scratch, 'prepared-{}.jpg'.format(source_hash), prepared_path(source_hash))
+        if cached is not None:
+            prepared[idx] = cached
+        else:
+            todo.setdefault(source_hash, []).append(idx)
+    if not todo:
+        return prepared
+
+    # Oversized images are far beyond the spool size, so they are on disk already and path() costs nothing
+    with ProcessPoolExecutor(max_workers=max(1, min(PROCESS_WORKERS, len(todo)))) as executor:
+        futures = {source_hash: executor.submit(_shrink, str(media_list[idxs[0]].path())) for source_hash, idxs in todo.items()}
+        for source_hash, future in futures.items():
+            data, size, quality = future.result()
+            media = scratch.new_media('prepared-{}.jpg'.format(source_hash))
+            media.write(data)
+            media.close()
+            media.persist(prepared_path(source_hash))
+            for idx in todo[source_hash]:
+                prepared[idx] = media
+            logger.info('Prepared image %s -> %r (%sx%s, quality %s).', media_list[todo[source_hash][0]].name, media, size[0], size[1], quality)
+
+    return prepared
+
+def make_thumbnail(media, scratch):
+    # Rendered in memory from the first frame's Media, cached by source hash like prepared images
+    source_hash = media_hash(media)
+    cached = _cached(scratch, 'thumbnail.jpg', thumbnail_path(source_hash))
+    if cached is not None:
+        return cached
+    from PIL import Image
+    with Image.open(media.open()) as image:
+        image.draft('RGB', (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        image = image.convert('RGB')
+        image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS)
+        data = _encode(image, QUALITY_STEPS[0])
+    thumbnail = scratch.new_media('thumbnail.jpg')
+    thumbnail.write(data)
+    thumbnail.close()
+    thumbnail.persist(thumbnail_path(source_hash))
+    logger.info('Created thumbnail %r.', thumbnail)
+    return thumbnail
@@ -0,0 +1,70 @@
+import time
+import json
+import sqlite3
+import logging
+import threading
+
+from .settings import config, DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_PATH = DATA_DIR / config['Storage']['RUN_JOURNAL']
+RETENTION_DAYS = config.getfloat('Storage', 'JOURNAL_RETENTION_DAYS')
+
+_db_guard = threading.Lock()
+
+# One row per completed step of a post: thread_key is the root tweet id, target the subreddit it is posted to,
+# result the step's JSON-encoded result (imgur ids, submission id, ...), enough to continue from the next step
+
+def _connect():
+    JOURNAL_PATH.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(str(JOURNAL_PATH), timeout=30)
+    connection.execute('CREATE TABLE IF NOT EXISTS steps ('
+                       'thread_key TEXT, target TEXT, step TEXT, result TEXT, completed_at REAL, PRIMARY KEY (thread_key, target, step))')
+    return connection
+
+def load(thread_key, target):
+    # {step: result} of every step already completed for this post, {} if the journal can't be read
+    try:
+        with _db_guard:
+            connection = _connect()
+            try:
+                rows = connection.execute('SELECT step, result FROM steps WHERE thread_key = ? AND target = ?', (thread_key, target)).fetchall()
+            finally:
+                connection.close()
+    except sqlite3.Error as ex:
+        logger.info('Run journal unavailable, running every step of %s.', thread_key)
+        logger.exception(ex)
+        return {}
+    return {step: json.loads(result) for step, result in rows}
+
+def record(thread_key, target, step, result):
+    # Called right after a step succeeds; a journal that can't be written only costs the resume, not the post
+    try:
+        with _db_guard:
+            connection = _connect()
+            try:
+                with connection:
+                    connection.execute('INSERT OR REPLACE INTO steps VALUES (?, ?, ?, ?, ?)', (thread_key, target, step, json.dumps(result), time.time()))
+            finally:
+                connection.close()
+    except sqlite3.Error as ex:
+        logger.info('Could not record step %s of %s in run journal.', step, thread_key)
+        logger.exception(ex)
+
+def prune(max_age_days=RETENTION_DAYS):
+    # Old posts are out of the timeline cursor's reach anyway, only a CUSTOM_TWEET_IDS rerun could still use them
+    try:
+        with _db_guard:
+            connection = _connect()
+            try:
+                with connection:
+                    deleted = connection.execute('DELETE FROM steps WHERE completed_at < ?', (time.time() - max_age_days * 24 * 60 * 60,)).rowcount
+            finally:
+                connection.close()
+    except sqlite3.Error as ex:
+        logger.info('Could not prune run journal.')
+        logger.exception(ex)
+        return
+    if deleted:
+        logger.info('Pruned %s steps from run journal.', deleted)
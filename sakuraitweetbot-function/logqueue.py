@@ -0,0 +1,44 @@
+import queue
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+FORMAT = '%(asctime)s %(levelname)s (%(name)s): %(message)s'
+DATEFMT = '%m/%d/%Y %I:%M:%S %p'
+
+_listener = None
+_queue_handler = None
+
+class LazyQueueHandler(QueueHandler):
+    # The stock QueueHandler formats the message in the calling thread; records stay in this process,
+    # so leave %-formatting (and exc_info rendering) to the listener's background thread
+    def prepare(self, record):
+        return record
+
+def start(filename, level=logging.DEBUG):
+    # Root logger -> in-memory queue -> background thread -> file
+    global _listener, _queue_handler
+    stop()
+
+    file_handler = logging.FileHandler(filename, mode='w')
+    file_handler.setFormatter(logging.Formatter(FORMAT, DATEFMT))
+
+    log_queue = queue.Queue(-1)
+    _queue_handler = LazyQueueHandler(log_queue)
+    _listener = QueueListener(log_queue, file_handler)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(_queue_handler)
+
+def stop():
+    # Drains the queue and closes the file; call at the end of every invocation
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    logging.getLogger().removeHandler(_queue_handler)
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+    _queue_handler = None
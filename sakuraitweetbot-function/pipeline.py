@@ -0,0 +1,94 @@
+import time
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from .settings import config
+from . import tracing
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = config.getint('Pipeline', 'MAX_WORKERS')
+
+# fn(results) gets the dict of finished stage results (at least everything in deps) and returns this stage's result
+Stage = namedtuple('Stage', ['name', 'fn', 'deps'])
+
+class StageError(Exception):
+    pass
+
+def skipped_stages(stages, done):
+    # Stages in done are skipped, and so is every stage whose dependents are all skipped: its result is not needed
+    # anymore (e.g. nothing has to be downloaded once everything that uses the download is done). Stages without
+    # dependents are only skipped when done, they run for their side effects
+    dependents = {name: [] for name in stages}
+    for stage in stages.values():
+        for dep in stage.deps:
+            dependents[dep].append(stage.name)
+
+    skipped = set(done)
+    changed = True
+    while changed:
+        changed = False
+        for name in stages:
+            if name not in skipped and dependents[name] and all(dependent in skipped for dependent in dependents[name]):
+                skipped.add(name)
+                changed = True
+    return skipped
+
+def run_stages(stages, max_workers=MAX_WORKERS, done=None):
+    # Runs every stage as soon as all of its deps are done, independent stages run concurrently
+    # done: results of stages finished earlier (e.g. by a previous run), those stages and whatever only they need are skipped
+    # Returns (results, timings) keyed by stage name. A failed stage only stops the stages downstream of it, everything
+    # else still runs (e.g. a live reddit post still gets its comment and moderation when imgur is down); the first
+    # failure is re-raised once no more stages can run
+    stages = {stage.name: stage for stage in stages}
+    for stage in stages.values():
+        for dep in stage.deps:
+            if dep not in stages:
+                raise StageError('Stage {} depends on unknown stage {}'.format(stage.name, dep))
+
+    done = {name: result for name, result in (done or {}).items() if name in stages}
+    skipped = skipped_stages(stages, done)
+    if skipped:
+        logger.info('Skipping stages: %s', sorted(skipped))
+
+    results = dict(done)
+    timings = {}
+    remaining = {name: stage for name, stage in stages.items() if name not in skipped}
+    running = {}
+    failure = None
+
+    def timed(stage, inputs):
+        start = time.perf_counter()
+        try:
+            with tracing.span('stage.' + stage.name): # aggregated over the run
+                return stage.fn(inputs)
+        finally:
+            timings[stage.name] = time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while remaining or running:
+            for name, stage in list(remaining.items()):
+                if all(dep in results for dep in stage.deps):
+                    running[executor.submit(timed, stage, dict(results))] = name
+                    del remaining[name]
+            if not running:
+                if remaining and failure is None:
+                    raise StageError('Dependency cycle between stages: {}'.format(sorted(remaining)))
+                if remaining:
+                    logger.info('Not running stages downstream of the failure: %s', sorted(remaining))
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as ex:
+                    logger.info('Stage %s failed.', name)
+                    if failure is None:
+                        failure = ex
+
+    if failure is not None:
+        raise failure
+    return results, timings
@@ -0,0 +1,61 @@
+import time
+import threading
+
+class TokenBucket:
+    # Thread-safe token bucket: capacity tokens at most, refilled at rate tokens per second
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens=1):
+        # Blocks until tokens are available, returns the time spent waiting
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+class RateGovernor(TokenBucket):
+    # Token bucket for an API that reports its remaining quota: update() lowers the rate to what is left of the
+    # current window, pause() holds back every caller until a delay given by the server has passed
+    def __init__(self, rate, capacity):
+        super().__init__(rate, capacity)
+        self.max_rate = rate
+        self.paused_until = 0.0
+
+    def update(self, remaining, reset):
+        # remaining requests allowed in the next reset seconds
+        if remaining <= 0:
+            self.pause(max(reset, 1.0))
+            return
+        with self.lock:
+            self._refill()
+            self.rate = min(self.max_rate, remaining / max(reset, 1.0))
+            self.tokens = min(self.tokens, remaining)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def acquire(self, tokens=1):
+        waited = 0.0
+        while True:
+            with self.lock:
+                delay = self.paused_until - time.monotonic()
+            if delay <= 0:
+                return waited + super().acquire(tokens)
+            time.sleep(delay)
+            waited += delay
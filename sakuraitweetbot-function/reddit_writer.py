@@ -0,0 +1,72 @@
+import os
+import re
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+
+from .settings import config
+from . import ratelimit
+
+logger = logging.getLogger(__name__)
+
+WRITE_WORKERS = config.getint('Reddit', 'WRITE_WORKERS')
+MAX_ATTEMPTS = config.getint('Reddit', 'MAX_ATTEMPTS')
+MAX_RATELIMIT_WAIT = config.getfloat('Reddit', 'MAX_RATELIMIT_WAIT')
+
+# Every reddit write (submit, reply, distinguish, approve) of every job goes through one queue: writes run
+# concurrently on WRITE_WORKERS threads, each one only after the governor hands out a token. The governor starts
+# at the configured rate and follows reddit's X-Ratelimit-* headers from there (see governed_session)
+governor = ratelimit.RateGovernor(rate=config.getfloat('Reddit', 'MAX_WRITES_PER_MINUTE') / 60, capacity=config.getint('Reddit', 'WRITES_BURST'))
+_executor = ThreadPoolExecutor(max_workers=WRITE_WORKERS, thread_name_prefix='reddit-write')
+
+def observe_response(response, *args, **kwargs):
+    # requests response hook: X-Ratelimit-Remaining requests are left for the next X-Ratelimit-Reset seconds
+    remaining = response.headers.get('X-Ratelimit-Remaining')
+    reset = response.headers.get('X-Ratelimit-Reset')
+    if remaining is not None and reset is not None:
+        governor.update(float(remaining), float(reset))
+
+def governed_session():
+    # Session for praw's requestor, so every reddit response (reads included) feeds the governor
+    session = requests.Session()
+    session.hooks['response'].append(observe_response)
+    return session
+
+def ratelimit_delay(ex):
+    # Seconds reddit asks to wait if ex is a RATELIMIT API error (praw's RedditAPIException items, or APIException itself)
+    for item in getattr(ex, 'items', None) or [ex]:
+        if getattr(item, 'error_type', None) == 'RATELIMIT':
+            match = re.search(r'(\d+) (millisecond|second|minute)', getattr(item, 'message', None) or '')
+            if match is None:
+                return 60.0
+            return int(match.group(1)) * {'millisecond': 0.001, 'second': 1, 'minute': 60}[match.group(2)]
+    return None
+
+def _write(label, write_fn):
+    # Only RATELIMIT is retried: reddit rejected the write, so repeating it can't double-post
+    for i in range(0, MAX_ATTEMPTS):
+        governor.acquire()
+        try:
+            return write_fn()
+        except Exception as ex:
+            delay = ratelimit_delay(ex)
+            if delay is None or delay > MAX_RATELIMIT_WAIT or i == MAX_ATTEMPTS - 1:
+                raise
+            logger.info('Reddit RATELIMIT on %s, attempt #%s, retrying in %.1fs... (%s max attempts)', label, i + 1, delay, MAX_ATTEMPTS) # 1-index attempts
+            if os.environ['SLEEP_MODE'] == 'True':
+                governor.pause(delay) # the limit is per account, hold back every queued write
+
+def queue(label, write_fn):
+    # Returns a Future of write_fn's result
+    return _executor.submit(_write, label, write_fn)
+
+def write(label, write_fn):
+    return queue(label, write_fn).result()
+
+def write_all(writes):
+    # (label, write_fn) pairs that don't depend on each other, results in the same order; every write finishes
+    # (or fails) before the first exception is re-raised
+    futures = [queue(label, write_fn) for label, write_fn in writes]
+    wait(futures)
+    return [future.result() for future in futures]
@@ -1,121 +1,67 @@
 import os
-import requests
 import uuid
 import json
-import urllib
-import pathlib
 import logging
-import glob
-from PIL import Image
-from datetime import datetime, timedelta
-import time
-from configparser import ConfigParser
+from datetime import datetime
+
+from .settings import TEST_MODE, config
+from . import downloader
+from . import uploader
+from . import http_client
+from . import translation_cache
+from . import timeline
+from . import threads
+from . import batch
+from . import reddit_writer
+from . import pipeline
+from . import imaging
+from . import tracing
+from . import clients
+from . import album
+from . import journal
+from . import workspace
 
-import praw
-import tweepy
-import ffmpeg
-
-# Flight variables
-TEST_MODE = os.environ['TEST_MODE'] == 'True'
-
-# Get path for parent directory (PathLike)
-parent = pathlib.Path(__file__).parent
-
-# Path for temp folder in Azure Functions (Linux)
-tmp = pathlib.Path("/tmp")
+logger = logging.getLogger(__name__)
 
-# Read config files
-config = ConfigParser()
-config.read(parent / 'cfg/config.ini')
+def post_image_to_reddit(subreddit, media, title):
+    # Reddit upload, praw wants a path so the Media is spilled to the job's scratch directory
+    return subreddit.submit_image(title=title, image_path=str(media.path()), flair_id=None if TEST_MODE else config['Reddit']['FLAIR_ID'])
 
-# FFMPEG path (PathLike)
-FFMPEG_PATH = parent / '../bin/ffmpeg-git-20200504-amd64-static/ffmpeg'
-TMP_FFMPEG_PATH = "/tmp/ffmpeg"
+def create_video_from_urls(media_urls, scratch):
+    from . import video # PIL and ffmpeg are only loaded on the video path
 
-logger = logging.getLogger(__name__)
+    # Download images (in parallel, into the job's workspace) and stream them to ffmpeg
+    media_list = downloader.download_all(media_urls, scratch)
+    video_fp = video.build_video(media_list, scratch.path('video.mp4'))
+    thumbnail = imaging.make_thumbnail(media_list[0], scratch)
+    return video_fp, thumbnail.path()
 
-def cleanup_media():
-    pics = glob.glob(str(tmp / '*.jpg')) # glob doesn't accept PathLike, see: https://bugs.python.org/issue35453
-    vids = glob.glob(str(tmp / '*.mp4'))
-    to_delete = pics + vids
-    for fp in to_delete:
-        try:
-            os.remove(fp)
-            logger.info('Removed file: {}'.format(fp))
-        except Exception as ex:
-            logger.info('Error while deleting file: {}'.format(fp))
-            logger.exception(ex)
-            continue
-
-def post_image_to_reddit(subreddit, media_url, title):
-    # Download image
-    image_fp = tmp / 'image.jpg'
-    urllib.request.urlretrieve(media_url, image_fp) # accepts PathLike
-
-    # Reddit upload
-    return subreddit.submit_image(title=title, image_path=image_fp, flair_id=None if TEST_MODE else config['Reddit']['FLAIR_ID'])
-
-def create_video_from_urls(media_urls):
-    # Download images
-    last_idx = 0
-    for idx, media_url in enumerate(media_urls):
-        image_fp = tmp / 'image-{}.jpg'.format(str(idx).zfill(3))
-        if idx == 0:
-            thumbnail_path = image_fp
-        urllib.request.urlretrieve(media_url, image_fp) # accepts PathLike
-        logger.info('Downloaded image {}.'.format(image_fp))
-        last_idx = idx
-        
-    # ffmpeg conversion
-    image_seq_fp = str(tmp / 'image-%03d.jpg') # TODO: need to check if ffmpeg.input accepts PathLike, see: https://github.com/kkroening/ffmpeg-python/issues/364
-    video_fp = str(tmp / 'video.mp4')
-
-    # Create black frame for end of video (hypothesizing Reddit cuts last still frame in video)
-    size = Image.open('image-001.jpg').size
-    black = Image.new('RGB', size)
-    black_fp = tmp / 'image-{}.jpg'.format(str(last_idx).zfill(3))
-    black.save(black_fp, "PNG")
-
-    # Equivalent to cmd line: "{TMP_FFMPEG_PATH} -loop 1 -i {image_seq_fp} -t 10 {video_fp} -framerate 1/5"
-    out, err = ffmpeg.input(image_seq_fp, loop=1, t=10, framerate=1/5).output(video_fp).run(cmd=TMP_FFMPEG_PATH, quiet=True)
-
-    logger.info('ffmpeg stdout: {}'.format(out))
-    logger.info('ffmpeg stderr: {}'.format(err))
-
-    return video_fp, thumbnail_path
-
-def post_gallery_to_reddit(subreddit, media_urls, title):
-    tmp = pathlib.Path('/tmp')
-    last_idx = 0
-    image_fps = []
-    for idx, media_url in enumerate(media_urls):
-        image_fp = tmp / 'image-{}.jpg'.format(idx)
-        urllib.request.urlretrieve(media_url, image_fp) # accepts PathLike
-        image_fps.append(image_fp)
-        logger.info('Downloaded image {}.'.format(image_fp))
-
-    images = [{'image_path': image_fp} for image_fp in image_fps]
-    title += ' ({} images!)'.format(len(media_urls))
+def post_gallery_to_reddit(subreddit, media_list, title):
+    images = [{'image_path': str(media.path())} for media in media_list]
+    title += ' ({} images!)'.format(len(media_list))
     submission = subreddit.submit_gallery(title=title, images=images, flair_id=None if TEST_MODE else config['Reddit']['FLAIR_ID'])
-    logger.info('Reddit gallery submission: {}'.format(submission.__dict__))
+    logger.info('Reddit gallery submission: %s', submission)
     return submission
 
-def post_video_to_reddit(subreddit, media_urls, title):
-    video_fp, thumbnail_path = create_video_from_urls(media_urls)
+def post_video_to_reddit(subreddit, media_urls, title, scratch):
+    video_fp, thumbnail_path = create_video_from_urls(media_urls, scratch)
     title += ' ({} images!)'.format(len(media_urls))
     submission = subreddit.submit_video(title=title, video_path=video_fp, videogif=False, thumbnail_path=thumbnail_path, flair_id=None if TEST_MODE else config['Reddit']['FLAIR_ID'])
-    logger.info('Reddit video submission: {}'.format(submission.__dict__))
+    logger.info('Reddit video submission: %s', submission)
     return submission
 
 def post_link_to_reddit(subreddit, url, title):
     submission = subreddit.submit(title=title, url=url, flair_id=None if TEST_MODE else config['Reddit']['FLAIR_ID'])
-    logger.info('Reddit link submission: {}'.format(submission.__dict__))
+    logger.info('Reddit link submission: %s', submission)
     return submission
 
+@tracing.traced('translate')
 def translate_text(text_list):
+    # Only texts missing from the persistent cache go over the wire (deduped and batched)
+    return translation_cache.translate(text_list, 'ja', 'en', request_translations)
+
+def request_translations(text_list):
     # Check https://docs.microsoft.com/en-us/azure/cognitive-services/translator/quickstart-translator?tabs=python for reference
-    api_key = os.environ['AZURE_TRANSLATOR_API_KEY']
-    region = os.environ['AZURE_REGION']
     endpoint = config['Azure']['TRANSLATE_ENDPOINT']
 
     params = {
@@ -124,26 +70,23 @@ def translate_text(text_list):
         'to': 'en'
     }
 
-    headers = {
-        'Ocp-Apim-Subscription-Key': api_key,
-        'Ocp-Apim-Subscription-Region' : region,
-        'Content-type': 'application/json',
-        'X-ClientTraceId': str(uuid.uuid4())
-    }
+    headers = dict(http_client.translator_headers(), **{'X-ClientTraceId': str(uuid.uuid4())})
 
     body = [{'text': text} for text in text_list]
-    logger.info('Request body: {}'.format(body))
+    logger.debug('Request body: %s', body)
 
-    request = requests.post(endpoint, params=params, headers=headers, json=body)
+    request = http_client.post(endpoint, endpoint='translator.translate', params=params, headers=headers, json=body)
+    request.raise_for_status()
 
     response = request.json()
-    logger.info('Translations: {}'.format(response))
+    logger.debug('Translations: %s', response)
 
     translations = [res['translations'][0]['text'] for res in response]
 
     return translations
 
-def create_reddit_comment(tweet_url, media_urls, text_list, submission):
+def render_reddit_comment(tweet_url, media_urls, text_list, translations):
+    # Comment body only, so it can be rendered while the submission is still in flight
     comment = '[Original Tweet]({}) and '.format(tweet_url)
     
     if len(media_urls) > 1:
@@ -156,7 +99,6 @@ def create_reddit_comment(tweet_url, media_urls, text_list, submission):
         comment += '[Full-Size Image!]({})\n\n'.format(media_urls[0])
 
     if text_list:
-        translations = translate_text(text_list)
         if len(translations) > 1:
             for idx, translation in enumerate(translations):
                 comment += 'Tweet {} Text:\n\n'.format(idx + 1) # 1-index
@@ -176,222 +118,313 @@ def create_reddit_comment(tweet_url, media_urls, text_list, submission):
 
     if text_list:
         comment += '*^Translated ^using ^([Microsoft Azure Translator](https://azure.microsoft.com/en-us/services/cognitive-services/translator/).)*'
-    
+
+    return comment
+
+def create_reddit_comment(submission, comment):
     reply = submission.reply(comment)
-    logger.info('Reddit reply: {}'.format(reply.__dict__))
+    logger.info('Reddit reply: %s', reply)
     return reply
 
-def create_imgur_post(media_url, title, tweet_url, idx, num_images):
+def create_imgur_post(media, title, tweet_url, idx, num_images):
     if num_images > 1:
         title = title + ' (Image {})'.format(idx + 1) # 1-indexed when displaying
-    headers = {'Authorization': 'Bearer ' + os.environ['IMGUR_ACCESS_TOKEN']}
+    headers = http_client.imgur_headers()
     data = {'title': title,
-            'image': media_url,
             'description': 'Original Tweet: {}'.format(tweet_url).replace('.', '&#46;'), # imgur bug workaround, see https://github.com/DamienDennehy/Imgur.API/issues/8
-            'type': 'URL'}
-    logger.info('data for CREATE_IMGUR_POST POST request: {}'.format(data))
-
-    MAX_ATTEMPTS = 5
-    for i in range(0, MAX_ATTEMPTS):
-        request = requests.post(config['Imgur']['UPLOAD_IMAGE_API'], data=data, headers=headers)
-        json = request.json()
-        logger.info('JSON for CREATE_IMGUR_POST POST request, attempt #{}:\n{}'.format(i + 1, json)) # 1-index attempts
-        if json['success']:
-            break
-        else:
-            if (i == MAX_ATTEMPTS - 1):
-                logger.warning('Failed POST request after {} attempts. Terminating.'.format(MAX_ATTEMPTS))
-            else:
-                logger.info('Failed POST request, attempt #{}, retrying... ({} max attempts)'.format(i + 1, MAX_ATTEMPTS)) # 1-index attempts
-                if os.environ['SLEEP_MODE'] == 'True':
-                    time.sleep(90) # sleep for 90 seconds; find better way to do this, not ideal.
+            'type': 'file'} # upload the downloaded copy instead of making imgur fetch the url again
+    logger.debug('data for CREATE_IMGUR_POST POST request: %s', data)
+
+    def upload():
+        with media.open() as image: # straight from the in-memory buffer for most images
+            return http_client.post(config['Imgur']['UPLOAD_IMAGE_API'], endpoint='imgur.image.upload', data=data, files={'image': (media.name, image)}, headers=headers)
 
-    image_id = json['data']['id']
-    image_url = json['data']['link']
+    json_data = uploader.upload_with_retries(upload, 'CREATE_IMGUR_POST POST request (image {})'.format(idx + 1))
+
+    image_id = json_data['id']
+    image_url = json_data['link']
 
     return image_id, image_url
 
+@tracing.traced('upload')
+def upload_images_to_imgur(media_list, title, tweet_url):
+    # Upload all of a tweet's images at once; (image_id, image_url) list keeps the original image order
+    num_images = len(media_list)
+    upload_fns = [(lambda idx=idx, media=media: create_imgur_post(media, title, tweet_url, idx, num_images)) for idx, media in enumerate(media_list)]
+    return uploader.upload_all(upload_fns)
+
 def create_imgur_album():
-    headers = {'Authorization': 'Bearer ' + os.environ['IMGUR_ACCESS_TOKEN']}
+    headers = http_client.imgur_headers()
     data = {'title': 'New Smash Pic-of-the-Day Album! by /u/SakuraiTweetBot',
             'description': 'An album containing each Smash pic-of-the-day posted by @Sora_Sakurai on Twitter, mirrored to /r/smashbros on Reddit by /u/SakuraiTweetBot.',
             'privacy': 'public'       
         }
-    logger.info('data for CREATE_IMGUR_ALBUM POST request: {}'.format(data))
-    request = requests.post(config['Imgur']['CREATE_ALBUM_API'], data=data, headers=headers)
+    logger.debug('data for CREATE_IMGUR_ALBUM POST request: %s', data)
+    request = http_client.post(config['Imgur']['CREATE_ALBUM_API'], endpoint='imgur.album.create', data=data, headers=headers)
 
     json = request.json()
-    logger.info('JSON for CREATE_IMGUR_ALBUM POST request:\n{}'.format(json))
+    logger.debug('JSON for CREATE_IMGUR_ALBUM POST request:\n%s', json)
 
     album_hash = json['data']['id']
     return album_hash
 
-def update_imgur_album(image_ids):
-    headers = {'Authorization': 'Bearer ' + os.environ['IMGUR_ACCESS_TOKEN']}
-    # GET request to get ids of images in album in order
-    request = requests.get(config['Imgur']['CREATE_ALBUM_API'] + '/{}/images'.format(os.environ['IMGUR_ALBUM_ID']), headers=headers)
-    
-    album_ids = [image['id'] for image in request.json()['data']]
-    logger.info('album_ids from UPDATE_IMGUR_ALBUM GET request: {}'.format(album_ids))
-
-    album_ids = image_ids + album_ids # prepend new images to list
-
-    # POST request to set image ids in album
-    data = {'ids[]': album_ids}
-
-    request = requests.post(config['Imgur']['CREATE_ALBUM_API'] + '/{}/'.format(os.environ['IMGUR_ALBUM_ID']), data=data, headers=headers)
-    logger.info('data for UPDATE_IMGUR_ALBUM POST request: {}'.format(data))
+def imgur_album_url(path=''):
+    return config['Imgur']['CREATE_ALBUM_API'] + '/{}{}'.format(os.environ['IMGUR_ALBUM_ID'], path)
 
+def checked_imgur_json(request, label):
     json = request.json()
-    logger.info('JSON for UPDATE_IMGUR_ALBUM POST request:\n{}'.format(json))
+    logger.debug('JSON for %s request:\n%s', label, json)
+    if not json.get('success'):
+        raise album.AlbumError('{} failed with status {}: {}'.format(label, request.status_code, json))
+    return json
 
-    # PUT request to update cover to id of top of album
-    data = {'cover': album_ids[0]}
+def fetch_imgur_album_ids():
+    # GET request to get ids of images in album in order
+    request = http_client.get(imgur_album_url('/images'), endpoint='imgur.album.images', headers=http_client.imgur_headers())
+    return [image['id'] for image in checked_imgur_json(request, 'IMGUR_ALBUM_IMAGES GET')['data']]
 
-    request = requests.put(config['Imgur']['CREATE_ALBUM_API'] + '/{}'.format(os.environ['IMGUR_ALBUM_ID']), data=data, headers=headers)
-    logger.info('data for UPDATE_IMGUR_ALBUM PUT request: {}'.format(data))
+def set_imgur_album(image_ids, cover):
+    # POST request to set image ids in album, in order, and its cover
+    data = {'ids[]': image_ids, 'cover': cover}
+    logger.debug('data for SET_IMGUR_ALBUM POST request: %s', data)
+    request = http_client.post(imgur_album_url(), endpoint='imgur.album.update', data=data, headers=http_client.imgur_headers())
+    checked_imgur_json(request, 'SET_IMGUR_ALBUM POST')
 
-    json = request.json()
-    logger.info('JSON for UPDATE_IMGUR_ALBUM PUT request:\n{}'.format(json))
+def update_imgur_album(image_ids):
+    # The local album index knows what is already in the album (no read before each write), see album.update
+    album.update(os.environ['IMGUR_ALBUM_ID'], image_ids, fetch_imgur_album_ids, set_imgur_album)
 
 def post_to_imgur_gallery(image_ids, title):
-    headers = {'Authorization': 'Bearer ' + os.environ['IMGUR_ACCESS_TOKEN']}
+    headers = http_client.imgur_headers()
     # POST request to add image_ids to imgur public gallery
     data = {'title': title,
             'terms': 1,
             'mature': 0,
             'tags':'smashbros'}
-    logger.info('data for POST_TO_IMGUR_GALLERY POST request: {}'.format(data))
-    request = requests.post(config['Imgur']['UPLOAD_IMAGE_GALLERY'] + '/{}'.format(iid), data=data, headers=headers)
+    logger.debug('data for POST_TO_IMGUR_GALLERY POST request: %s', data)
+    request = http_client.post(config['Imgur']['UPLOAD_IMAGE_GALLERY'] + '/{}'.format(iid), endpoint='imgur.gallery.share', data=data, headers=headers)
     json = request.json()
-    logger.info('JSON for POST_TO_IMGUR_GALLERY POST POST request:\n{}'.format(json))
-
-def main(custom_tweet_ids=None):
-    logger.info('TEST_MODE={}'.format(TEST_MODE))
-    logger.info('custom_tweet_ids={}'.format(custom_tweet_ids))
-
-    # Cleanup media before start
-    cleanup_media()
-    logger.info('Cleaned up media.')
+    logger.debug('JSON for POST_TO_IMGUR_GALLERY POST POST request:\n%s', json)
+
+def parse_date(date_string):
+    # 'YYYY-MM-DD' (UTC) -> naive datetime, as used for backfill date ranges
+    if not date_string:
+        return None
+    return datetime.strptime(date_string, '%Y-%m-%d')
+
+@tracing.traced('moderate')
+def moderate_submission(submission):
+    # Sticky and mod distinguish, independent writes so they go out together
+    reddit_writer.write_all([('distinguish submission', lambda: submission.mod.distinguish(how='yes', sticky=False)),
+                             ('approve submission', lambda: submission.mod.approve())])
+    logger.info('Distinguished, approved submission %s', submission)
+
+@tracing.traced('moderate')
+def moderate_reply(reply):
+    reddit_writer.write_all([('distinguish reply', lambda: reply.mod.distinguish(how='yes', sticky=True)),
+                             ('approve reply', lambda: reply.mod.approve())])
+    logger.info('Distinguished, approved stickied comment %s', reply)
+
+@tracing.traced('submit')
+def submit_thread(subreddit, title, media_list, image_uploads):
+    if len(media_list) > 1:
+        return reddit_writer.write('submit gallery', lambda: post_gallery_to_reddit(subreddit, media_list, title)) # post gallery to reddit
+    image_url = image_uploads[0][1] # only one image in tweet
+    return reddit_writer.write('submit link', lambda: post_link_to_reddit(subreddit, image_url, title)) # post link to imgur post
+
+@tracing.traced('album')
+def update_album_with(album_uploads, target):
+    # One album update for the whole run, after every job is done: (thread, image uploads) pairs go in newest post
+    # first, whatever order the jobs finished in; a post's own images stay in tweet order
+    album_uploads = sorted(album_uploads, key=lambda item: item[0].date, reverse=True)
+    update_imgur_album([iid for thread, image_uploads in album_uploads for iid, url in image_uploads])
+    for thread, image_uploads in album_uploads:
+        journal.record(str(thread.tweet_ids[0]), target, 'album_update', True)
+
+def unalbumed_uploads(thread, target):
+    # Imgur uploads of a post whose job failed after the upload step, still to go into the album
+    steps = journal.load(str(thread.tweet_ids[0]), target)
+    if 'imgur_upload' in steps and 'album_update' not in steps:
+        return JOURNALED_STEPS['imgur_upload'][1](steps['imgur_upload'])
+    return None
+
+def thread_stages(subreddit, thread, scratch, turnstile):
+    # Per-post dependency graph; translation/comment rendering doesn't wait on reddit
+    # scratch is the post's own workspace, every media file of the post lives (and dies) there
+    # turnstile puts the run's submits in thread order, everything else of the post runs as soon as it can
+    date_string = datetime.strftime(thread.date, '%m/%d/%Y')
+    base_title = 'New Smash Pic-of-the-Day! ({}) from @Sora_Sakurai'.format(date_string)
+    is_gallery = len(thread.media_urls) > 1
+
+    def submit(results):
+        with turnstile.turn(str(thread.tweet_ids[0])):
+            return submit_thread(subreddit, base_title, results['prepare'], results.get('imgur_upload'))
+
+    def reply(results):
+        return reddit_writer.write('reply', lambda: create_reddit_comment(results['submit'], results['render_comment']))
+
+    stages = [
+        # Download every image once, in parallel; imgur and reddit share the copies
+        pipeline.Stage('download', lambda results: downloader.download_all(thread.media_urls, scratch), []),
+        # Shrink anything over the reddit/imgur size limits (no-op for most pics)
+        pipeline.Stage('prepare', lambda results: imaging.prepare_all(results['download'], scratch), ['download']),
+        pipeline.Stage('imgur_upload', lambda results: upload_images_to_imgur(results['prepare'], base_title, thread.tweet_url), ['prepare']),
+        pipeline.Stage('translate', lambda results: translate_text(thread.text_list) if thread.text_list else [], []),
+        pipeline.Stage('render_comment', lambda results: render_reddit_comment(thread.tweet_url, thread.media_urls, thread.text_list, results['translate']), ['translate']),
+        # A gallery is uploaded to reddit directly, a single image is posted as a link to its imgur copy
+        pipeline.Stage('submit', submit, ['prepare'] if is_gallery else ['prepare', 'imgur_upload']),
+        pipeline.Stage('reply', reply, ['submit', 'render_comment']),
+        pipeline.Stage('moderate_submission', lambda results: moderate_submission(results['submit']), ['submit']),
+        pipeline.Stage('moderate_reply', lambda results: moderate_reply(results['reply']), ['reply']),
+    ]
+    return stages
+
+# Steps recorded in the run journal: how a step's result is stored, and how it is rebuilt on resume
+JOURNALED_STEPS = {
+    'imgur_upload': (lambda uploads: [list(upload) for upload in uploads], lambda stored: [tuple(upload) for upload in stored]),
+    'submit': (lambda submission: submission.id, lambda stored: clients.reddit().submission(id=stored)),
+    'reply': (lambda comment: comment.id, lambda stored: clients.reddit().comment(id=stored)),
+    'moderate_submission': (lambda result: True, lambda stored: None),
+    'moderate_reply': (lambda result: True, lambda stored: None),
+    'album_update': (lambda result: True, lambda stored: None), # recorded by update_album_with, once the run's jobs are done
+}
+
+def journaled(stage, thread_key, target):
+    encode = JOURNALED_STEPS[stage.name][0]
+
+    def fn(results):
+        result = stage.fn(results)
+        journal.record(thread_key, target, stage.name, encode(result))
+        return result
+    return pipeline.Stage(stage.name, fn, stage.deps)
+
+def post_thread(subreddit, thread, run_workspace, turnstile):
+    # Steps finished by an earlier (failed) run are not redone, the pipeline continues from the first incomplete one
+    # Returns (submission, reply, image uploads still to go into the album or None)
+    thread_key = str(thread.tweet_ids[0])
+    target = str(subreddit)
+    done = {step: JOURNALED_STEPS[step][1](stored) for step, stored in journal.load(thread_key, target).items() if step in JOURNALED_STEPS}
+    if done:
+        logger.info('Resuming %s, steps already done: %s', thread.tweet_url, sorted(done))
+
+    scratch = run_workspace.job('thread-{}'.format(thread_key))
+    try:
+        stages = [journaled(stage, thread_key, target) if stage.name in JOURNALED_STEPS else stage for stage in thread_stages(subreddit, thread, scratch, turnstile)]
+        results, timings = pipeline.run_stages(stages, done=done)
+    finally:
+        turnstile.done(thread_key) # a post that failed (or had already been submitted) doesn't hold up the next submit
+        scratch.cleanup() # frees the post's share of the memory budget for the jobs still running
+    logger.info('Stage timings for %s: %s', thread.tweet_url, timings)
+    return results['submit'], results['reply'], None if 'album_update' in done else results['imgur_upload']
+
+def main(custom_tweet_ids=None, since=None, until=None):
+    # Default: incremental run from the timeline cursor
+    # Batch modes: custom_tweet_ids (set of ids) or a since/until date range (naive UTC datetimes, until exclusive)
+    logger.info('TEST_MODE=%s', TEST_MODE)
+    logger.info('custom_tweet_ids=%s', custom_tweet_ids)
+    logger.info('since=%s, until=%s', since, until)
+
+    # Metrics are per run, a warm worker keeps the modules loaded between invocations
+    tracing.reset()
+    http_client.reset_metrics()
+
+    # Media only ever lives in this run's workspace, removed when the run ends
+    workspace.sweep()
+    run_workspace = workspace.new_run()
+    journal.prune()
+
+    # Fetch cursor state; only tweets that made it into a post are added to the ledger
+    cursor = None
+    fetch = None
+    pending_ids = set()
+    posted_ids = set()
 
     try:
-        # Twitter auth
-        twitter = tweepy.AppAuthHandler(consumer_key=os.environ['TWITTER_CONSUMER_KEY'], 
-                                    consumer_secret=os.environ['TWITTER_CONSUMER_SECRET'])
-        logger.info('Twitter auth complete.')
-        api = tweepy.API(twitter)
+        # Twitter auth (built once per worker, see clients)
+        api = clients.twitter_api()
 
-        # Get last TWEET_COUNT tweets
+        # Only fetch what is new since the last run (or exactly the custom tweet ids / date range)
         SCREEN_NAME = 'Sora_Sakurai'
-        TWEET_COUNT = 50
-        tweets = api.user_timeline(screen_name=SCREEN_NAME, count=TWEET_COUNT, tweet_mode='extended', include_rts=False, exclude_replies=False)
-        logger.info('Fetched last {} tweets from @{}.'.format(TWEET_COUNT, SCREEN_NAME))
-
-        # Filter last 200 tweets after 5:00 UTC of previous day that only contain media and store in set (tweet_url, media_url, date)
-        media_files = []
-
-        # Posting time usually at 11:00 PM EDT (3:00 UTC)
-        lower = datetime.utcnow().replace(hour=2, minute=30, second=0, microsecond=0) # yesterday 22:30/10:30 PM EDT, today 2:30 UTC
-        upper = lower + timedelta(hours=3, minutes=45) # today 00:15/12:15 AM EDT, today 5:15 UTC
-        logger.info('Lower bound time constraint: {}'.format(lower))
-        logger.info('Upper bound time constraint: {}'.format(upper))
-
-        tweet_ids = set()
-        # TODO: Integrate reply parsing properly; get rid of this below and the hacky way of extracting pictures from replies, use tweet.id and tweet.in_reply_to_status_id
-        # tweets is ordered by newest to oldest; in order to get Sakurai's reply tweets that have no media, need to check if tweet.in_reply_to_status_id is in tweet_ids set
-        for tweet in reversed(tweets):
-            date = tweet.created_at
-            if (custom_tweet_ids is not None and tweet.id in custom_tweet_ids) or (custom_tweet_ids is None and (date > lower and date < upper)):
-                logger.info('Tweet ID: {}'.format(tweet.id))
-                media = tweet.entities.get('media', [])
-                text = tweet.full_text # format is "{tweet} {url}", note the space; if no {tweet} then result is just "{url}" --- for media tweets; for text tweets, no url is present
-                if len(media) > 0:
-                    tweet_url = 'https://twitter.com/Sora_Sakurai/status/{}'.format(tweet.id)
-                    media_urls = ['{}?format=jpg&name=4096x4096'.format(med.get('media_url_https')) for med in tweet.extended_entities['media']] # for when more than one image to a tweet
-                    if ' ' not in text:
-                        text_list = [] # provide empty list
-                    else:
-                        text_list = [text.rsplit(' ', 1)[0]] # remove url so tweet extracted is just the text; when tweet has media, text also contains shortened url appended
-                    media_files.append((tweet_url, media_urls, text_list, date))
-                    tweet_ids.add(tweet.id)
-                elif tweet.in_reply_to_status_id in tweet_ids:
-                    tweet_url = 'https://twitter.com/Sora_Sakurai/status/{}'.format(tweet.id)
-                    media_urls = []
-                    text_list = [text.rsplit(' ', 1)[0]]
-                    media_files.append((tweet_url, media_urls, text_list, date))
-                    tweet_ids.add(tweet.id)
-        media_files.reverse()
-        logger.info('Number of filtered tweets: {}'.format(len(media_files)))
-        logger.info('Filtered tweets: {}'.format(media_files))
-
-        # Reddit auth
-        reddit = praw.Reddit(client_id=os.environ['REDDIT_CLIENT_ID'],
-                            client_secret=os.environ['REDDIT_CLIENT_SECRET'],
-                            user_agent=os.environ['REDDIT_USER_AGENT'],
-                            username=os.environ['REDDIT_USERNAME_TEST' if TEST_MODE else 'REDDIT_USERNAME'],
-                            password=os.environ['REDDIT_PASSWORD'])
-        logger.info('Reddit auth complete.')
+        cursor = timeline.load_cursor()
+        with tracing.span('fetch'):
+            if custom_tweet_ids is not None:
+                tweets = timeline.fetch_tweets_by_id(api, custom_tweet_ids)
+                logger.info('Fetched %s custom tweets.', len(tweets))
+            elif since is not None or until is not None:
+                posted = set(cursor['posted'])
+                tweets = [tweet for tweet in timeline.fetch_range(api, SCREEN_NAME, since, until) if tweet.id not in posted]
+                logger.info('Fetched %s unposted tweets from @%s between %s and %s.', len(tweets), SCREEN_NAME, since, until)
+            else:
+                fetch = timeline.fetch_new_tweets(api, SCREEN_NAME, cursor)
+                tweets = fetch.tweets
+                logger.info('Fetched %s new tweets from @%s.', len(tweets), SCREEN_NAME)
+
+        # Group media tweets with their self-replies, one thread per post (oldest first)
+        with tracing.span('filter'):
+            posts = threads.build_threads(tweets)
+        if fetch is not None:
+            pending_ids = set(tweet_id for thread in posts for tweet_id in thread.tweet_ids)
+        logger.info('Number of threads: %s', len(posts))
+        logger.debug('Threads: %s', posts)
+
+        # Reddit auth (built once per worker, see clients)
+        reddit = clients.reddit()
 
         subreddit = reddit.subreddit(config['Reddit']['SUBREDDIT_TEST' if TEST_MODE else 'SUBREDDIT'])
-        logger.info('Using subreddit: {}'.format(subreddit))
+        logger.info('Using subreddit: %s', subreddit)
 
-        # Iterate over filtered tweets to post to imgur/reddit, store in list outside scope
+        # Each thread is its own job; jobs run concurrently, reddit writes are paced by reddit_writer and submits go
+        # out in thread order (oldest first, like the timeline)
+        target = str(subreddit)
+        turnstile = batch.Turnstile([str(thread.tweet_ids[0]) for thread in posts])
         submissions = []
-
-        # Quick and hacky/dirty way to consolidate all pics into one post if extra tweets (i.e. in a reply)
-        if (len(media_files) > 1):
-            media_files.reverse() # if more than one tweet, most likely a reply in which case API returns most recent first -- should reverse for picture ordering
-            # Extract all other media_urls in other tweets and place in first media_files url list
-            for _, media_urls, text_list, _ in media_files[1:]:
-                media_files[0][1].extend(media_urls)
-                media_files[0][2].extend(text_list)
-            media_files = [media_files[0]] # remove all other tweets -- can fix this whole process later...
-
-        for tweet_url, media_urls, text_list, date in media_files:
-            date_string = datetime.strftime(date, '%m/%d/%Y')
-            base_title = 'New Smash Pic-of-the-Day! ({}) from @Sora_Sakurai'.format(date_string)
-
-            image_uploads = []
-            num_images = len(media_urls)
-            for idx, media_url in enumerate(media_urls): # post images to imgur
-                upload = create_imgur_post(media_url, base_title, tweet_url, idx, num_images)
-                image_uploads.append(upload)
-            if num_images > 1:
-                submission = post_gallery_to_reddit(subreddit, media_urls, base_title) # post gallery to reddit
-                cleanup_media()
-            else: # only one image in tweet
-                image_url = image_uploads[0][1]
-                submission = post_link_to_reddit(subreddit, image_url, base_title) # post link to imgur post       
-            
-            image_ids = [iid for iid, url in image_uploads]
-            
-            if not TEST_MODE:
-                update_imgur_album(image_ids)
-            
-            # Create Reddit comment
-            reply = create_reddit_comment(tweet_url, media_urls, text_list, submission)
-
-            # Sticky and mod distinguish
-            submission.mod.distinguish(how='yes', sticky=False)
-            submission.mod.approve()
-            logger.info('Distinguished, approved submission {}'.format(submission))
-
-            reply.mod.distinguish(how='yes', sticky=True)
-            reply.mod.approve()
-            logger.info('Distinguished, approved stickied comment {}'.format(reply))
-
-            submissions.append((submission, reply))
-
-        logger.info('Final submissions: {}'.format(submissions))
+        album_uploads = []
+        for thread, result, ex in batch.run_jobs(posts, lambda thread: post_thread(subreddit, thread, run_workspace, turnstile)):
+            if ex is None:
+                submission, reply, image_uploads = result
+                submissions.append((submission, reply))
+                posted_ids.update(thread.tweet_ids)
+            else:
+                image_uploads = unalbumed_uploads(thread, target)
+                if clients.is_auth_error(ex):
+                    clients.invalidate('reddit')
+            if image_uploads and not TEST_MODE:
+                album_uploads.append((thread, image_uploads))
+
+        logger.debug('Final submissions: %s', submissions)
+
+        if album_uploads:
+            try:
+                update_album_with(album_uploads, target)
+            except Exception as ex:
+                logger.exception(ex)
+                # Left out of the ledger, so the next run picks these threads up again and only redoes the album update
+                for thread, image_uploads in album_uploads:
+                    posted_ids.difference_update(thread.tweet_ids)
 
     except Exception as e:
         logger.exception(e)
+        if clients.is_auth_error(e):
+            clients.invalidate()
+    finally:
+        run_workspace.cleanup()
+
+    if cursor is not None:
+        timeline.save_cursor(timeline.advance_cursor(cursor, fetch, pending_ids, posted_ids))
+
+    tracing.emit_metrics(http=http_client.metrics_snapshot())
 
-if __name__ == '__main__':
+def main_from_env():
+    # Manual run, see __main__.py
     # Pass custom tweet ids as env variable string (sep==';')
     custom_tweet_ids = os.environ.get('CUSTOM_TWEET_IDS')
+    # Or a backfill date range as env variables (format=YYYY-MM-DD, UTC, until is exclusive)
+    backfill_since = os.environ.get('BACKFILL_SINCE')
+    backfill_until = os.environ.get('BACKFILL_UNTIL')
     if custom_tweet_ids:
         custom_tweet_ids = set(int(tweet_id) for tweet_id in custom_tweet_ids.split(';'))
         main(custom_tweet_ids)
+    elif backfill_since or backfill_until:
+        main(since=parse_date(backfill_since), until=parse_date(backfill_until))
     else: # custom_tweet_ids == None or custom_tweet_ids == ''
         main()
@@ -0,0 +1,19 @@
+import os
+import pathlib
+from configparser import ConfigParser
+
+# Flight variables
+TEST_MODE = os.environ['TEST_MODE'] == 'True'
+
+# Get path for parent directory (PathLike)
+parent = pathlib.Path(__file__).parent
+
+# Path for temp folder in Azure Functions (Linux)
+tmp = pathlib.Path("/tmp")
+
+# Read config files
+config = ConfigParser()
+config.read(parent / 'cfg/config.ini')
+
+# Persistent data (caches, cursors) lives on a mounted path that survives restarts, /home on Azure Functions (Linux)
+DATA_DIR = pathlib.Path(os.environ.get('SAKURAI_DATA_DIR') or config['Storage']['DATA_DIR'])
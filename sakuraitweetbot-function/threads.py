@@ -0,0 +1,53 @@
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# One Reddit post: a media tweet plus its self-replies, in thread order
+Thread = namedtuple('Thread', ['tweet_url', 'media_urls', 'text_list', 'date', 'tweet_ids'])
+
+def tweet_url(tweet):
+    return 'https://twitter.com/Sora_Sakurai/status/{}'.format(tweet.id)
+
+def tweet_media_urls(tweet):
+    if not tweet.entities.get('media'):
+        return []
+    return ['{}?format=jpg&name=4096x4096'.format(med.get('media_url_https')) for med in tweet.extended_entities['media']] # for when more than one image to a tweet
+
+def tweet_text(tweet):
+    # display_text_range excludes leading @mentions of replies and the trailing media url
+    text = tweet.full_text
+    display_text_range = getattr(tweet, 'display_text_range', None)
+    if display_text_range:
+        start, end = display_text_range
+        return text[start:end].strip()
+    if tweet.entities.get('media'):
+        return text.rsplit(' ', 1)[0] if ' ' in text else '' # format is "{tweet} {url}"; if no {tweet} then result is just "{url}"
+    return text
+
+def build_threads(tweets):
+    # tweets must be newest first (as returned by user_timeline); a single pass oldest -> newest
+    # indexes every kept tweet by id, so a reply is attached to its thread through in_reply_to_status_id
+    thread_of = {}
+    threads = []
+    for tweet in reversed(tweets):
+        media_urls = tweet_media_urls(tweet)
+        text = tweet_text(tweet)
+        thread = thread_of.get(tweet.in_reply_to_status_id)
+
+        if thread is None:
+            if not media_urls:
+                continue # plain text tweet, or a reply to something we are not posting
+            if tweet.in_reply_to_status_id is not None and tweet.in_reply_to_user_id != tweet.user.id:
+                continue # media reply to someone else, not a pic-of-the-day
+            thread = Thread(tweet_url(tweet), [], [], tweet.created_at, [])
+            threads.append(thread)
+
+        thread.media_urls.extend(media_urls)
+        if text:
+            thread.text_list.append(text)
+        thread.tweet_ids.append(tweet.id)
+        thread_of[tweet.id] = thread
+
+    logger.info('Built %s threads from %s tweets.', len(threads), len(tweets))
+    return threads
@@ -0,0 +1,133 @@
+import os
+import json
+import logging
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from .settings import config, DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+CURSOR_PATH = DATA_DIR / config['Storage']['TIMELINE_CURSOR']
+PAGE_SIZE = config.getint('Twitter', 'PAGE_SIZE')
+MAX_PAGES = config.getint('Twitter', 'MAX_PAGES')
+BOOTSTRAP_HOURS = config.getint('Twitter', 'BOOTSTRAP_HOURS')
+LEDGER_SIZE = config.getint('Twitter', 'LEDGER_SIZE')
+
+# Cursor format: {'since_id': newest tweet id already handled (or None), 'posted': [tweet ids already posted, newest last],
+#                 'resume': {'since_id': ..., 'max_id': ...} older tweets since_id < id <= max_id still to be fetched, or None}
+def load_cursor():
+    try:
+        with open(CURSOR_PATH) as f:
+            cursor = json.load(f)
+    except FileNotFoundError:
+        return {'since_id': None, 'posted': [], 'resume': None}
+    cursor.setdefault('resume', None) # cursors saved before resume points existed
+    logger.info('Loaded timeline cursor: since_id=%s, %s posted tweets in ledger, resume=%s.', cursor['since_id'], len(cursor['posted']), cursor['resume'])
+    return cursor
+
+def save_cursor(cursor):
+    CURSOR_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = CURSOR_PATH.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(cursor, f)
+    os.replace(tmp_path, CURSOR_PATH) # atomic, a crash never leaves a half-written cursor
+    logger.info('Saved timeline cursor: since_id=%s, %s posted tweets in ledger, resume=%s.', cursor['since_id'], len(cursor['posted']), cursor['resume'])
+
+def iter_pages(api, screen_name, since_id=None, max_id=None, max_pages=MAX_PAGES):
+    # Page back from max_id (or the newest tweet) until we reach since_id (or run out of pages), newest first
+    # Retweets are requested and left to the caller to drop (is_retweet): with include_rts=False twitter drops them
+    # after applying count, so an empty page would not mean the end of the timeline
+    for page_num in range(max_pages):
+        kwargs = {'screen_name': screen_name, 'count': PAGE_SIZE, 'tweet_mode': 'extended', 'include_rts': True, 'exclude_replies': False}
+        if since_id is not None:
+            kwargs['since_id'] = since_id
+        if max_id is not None:
+            kwargs['max_id'] = max_id
+        page = api.user_timeline(**kwargs)
+        logger.info('Fetched page %s of @%s timeline: %s tweets.', page_num + 1, screen_name, len(page))
+        if not page:
+            return
+        yield page
+        max_id = page[-1].id - 1
+
+def is_retweet(tweet):
+    return hasattr(tweet, 'retweeted_status')
+
+def fetch_timeline(api, screen_name, since_id=None, max_id=None, max_pages=MAX_PAGES):
+    # Returns (tweets newest first, retweets included; max_id to continue from if paging stopped at max_pages, else None)
+    pages = list(iter_pages(api, screen_name, since_id, max_id, max_pages))
+    resume_max_id = pages[-1][-1].id - 1 if len(pages) == max_pages else None
+    if resume_max_id is not None and since_id is not None and resume_max_id <= since_id:
+        resume_max_id = None # the last page ended right at since_id
+    return [tweet for page in pages for tweet in page], resume_max_id
+
+# tweets: tweets not in the posted ledger, newest first; since_id: newest tweet id fetched (the cursor's if none);
+# resume: the cursor's resume range after this fetch
+Fetch = namedtuple('Fetch', ['tweets', 'since_id', 'resume'])
+
+def fetch_new_tweets(api, screen_name, cursor):
+    # Tweets newer than the cursor, then (if paging got that far) the older ones of an unfinished earlier fetch
+    resume = cursor['resume']
+    if cursor['since_id'] is None:
+        # First run without a cursor: one page, limited to recent tweets so the whole timeline isn't mirrored
+        tweets, _ = fetch_timeline(api, screen_name, max_pages=1)
+        since_id = max((tweet.id for tweet in tweets), default=None)
+        lower = datetime.utcnow() - timedelta(hours=BOOTSTRAP_HOURS)
+        tweets = [tweet for tweet in tweets if tweet.created_at > lower]
+        logger.info('No timeline cursor, bootstrapping with tweets after %s.', lower)
+    else:
+        tweets, max_id = fetch_timeline(api, screen_name, since_id=cursor['since_id'], max_pages=MAX_PAGES)
+        since_id = max((tweet.id for tweet in tweets), default=cursor['since_id'])
+        if max_id is not None:
+            # Everything between the cursor (or an older resume point) and the oldest fetched tweet is fetched next run
+            resume = {'since_id': resume['since_id'] if resume else cursor['since_id'], 'max_id': max_id}
+            logger.warning('Stopped paging @%s timeline after %s pages, tweets %s < id <= %s will be fetched next run.', screen_name, MAX_PAGES, resume['since_id'], max_id)
+        elif resume is not None:
+            older, max_id = fetch_timeline(api, screen_name, since_id=resume['since_id'], max_id=resume['max_id'], max_pages=MAX_PAGES)
+            logger.info('Fetched %s older tweets of an unfinished fetch (%s < id <= %s).', len(older), resume['since_id'], resume['max_id'])
+            tweets += older
+            resume = None if max_id is None else dict(resume, max_id=max_id)
+
+    posted = set(cursor['posted'])
+    return Fetch([tweet for tweet in tweets if tweet.id not in posted and not is_retweet(tweet)], since_id, resume)
+
+def advance_cursor(cursor, fetch, pending_ids, posted_ids):
+    # fetch: this run's Fetch, None for custom/range runs (those only add to the ledger)
+    # Nothing pending (fetched into a thread but not posted) is left behind: one newer than the old cursor pins since_id
+    # right before it, an older one (from a resume range) keeps the resume range open down to it
+    ledger = cursor['posted'] + [tweet_id for tweet_id in sorted(posted_ids) if tweet_id not in cursor['posted']]
+    if fetch is None:
+        return dict(cursor, posted=ledger[-LEDGER_SIZE:])
+
+    since_id = fetch.since_id
+    resume = fetch.resume
+    pending_ids = set(pending_ids) - set(posted_ids)
+    newer = [tweet_id for tweet_id in pending_ids if cursor['since_id'] is None or tweet_id > cursor['since_id']]
+    older = [tweet_id for tweet_id in pending_ids if cursor['since_id'] is not None and tweet_id <= cursor['since_id']]
+    if newer:
+        since_id = min(newer) - 1
+    if older:
+        resume = {'since_id': min(older) - 1 if resume is None else min(min(older) - 1, resume['since_id']),
+                  'max_id': max(older) if resume is None else max(max(older), resume['max_id'])}
+    if cursor['since_id'] is not None and since_id is not None:
+        since_id = max(since_id, cursor['since_id'])
+    return {'since_id': since_id, 'posted': ledger[-LEDGER_SIZE:], 'resume': resume}
+
+def fetch_tweets_by_id(api, tweet_ids):
+    # statuses/lookup takes at most 100 ids per request
+    tweet_ids = sorted(tweet_ids)
+    tweets = []
+    for i in range(0, len(tweet_ids), 100):
+        tweets.extend(api.statuses_lookup(tweet_ids[i:i + 100], tweet_mode='extended'))
+    return sorted(tweets, key=lambda tweet: tweet.id, reverse=True) # newest first, like user_timeline
+
+def fetch_range(api, screen_name, since=None, until=None, max_pages=MAX_PAGES):
+    # Tweets with since <= created_at < until (naive UTC datetimes, either may be None), newest first
+    # Note the timeline API only reaches back ~3200 tweets
+    tweets = []
+    for page in iter_pages(api, screen_name, max_pages=max_pages):
+        tweets.extend(tweet for tweet in page if not is_retweet(tweet) and (since is None or tweet.created_at >= since) and (until is None or tweet.created_at < until))
+        if since is not None and page[-1].created_at < since:
+            break
+    return tweets
@@ -0,0 +1,57 @@
+import time
+import json
+import logging
+import threading
+import functools
+import contextlib
+
+logger = logging.getLogger(__name__)
+
+# Aggregated spans over the run: name -> {'count', 'errors', 'total', 'max'}
+_spans = {}
+_spans_guard = threading.Lock()
+
+def _record(name, elapsed, error):
+    with _spans_guard:
+        span = _spans.setdefault(name, {'count': 0, 'errors': 0, 'total': 0.0, 'max': 0.0})
+        span['count'] += 1
+        span['errors'] += 1 if error else 0
+        span['total'] += elapsed
+        span['max'] = max(span['max'], elapsed)
+
+@contextlib.contextmanager
+def span(name):
+    # with tracing.span('fetch'): ...
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        _record(name, time.perf_counter() - start, error)
+
+def traced(name):
+    # @tracing.traced('upload') on a function, same as wrapping its body in span(name)
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def snapshot():
+    with _spans_guard:
+        return {name: dict(span) for name, span in _spans.items()}
+
+def reset():
+    with _spans_guard:
+        _spans.clear()
+
+def emit_metrics(**extra):
+    # One JSON line with every span (and e.g. http metrics) at the end of the run
+    metrics = dict(extra, spans=snapshot())
+    logger.info('Run metrics: %s', json.dumps(metrics, sort_keys=True))
+    return metrics
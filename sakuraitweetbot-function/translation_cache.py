@@ -0,0 +1,100 @@
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+
+from .settings import config, DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = DATA_DIR / config['Storage']['TRANSLATION_CACHE']
+MAX_BATCH_TEXTS = config.getint('Azure', 'MAX_BATCH_TEXTS')
+MAX_BATCH_CHARS = config.getint('Azure', 'MAX_BATCH_CHARS')
+
+_db_guard = threading.Lock()
+
+def normalize(text):
+    # Same tweet text can come back with different unicode forms / line endings / padding
+    return unicodedata.normalize('NFC', text).replace('\r\n', '\n').strip()
+
+def cache_key(text, from_lang, to_lang):
+    return hashlib.sha256('{}\0{}\0{}'.format(from_lang, to_lang, normalize(text)).encode('utf-8')).hexdigest()
+
+def _connect():
+    CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(str(CACHE_PATH), timeout=30)
+    connection.execute('CREATE TABLE IF NOT EXISTS translations ('
+                       'key TEXT PRIMARY KEY, from_lang TEXT, to_lang TEXT, source TEXT, translation TEXT, created_at REAL)')
+    return connection
+
+def _lookup(keys):
+    if not keys:
+        return {}
+    with _db_guard:
+        connection = _connect()
+        try:
+            rows = connection.execute('SELECT key, translation FROM translations WHERE key IN ({})'.format(','.join('?' * len(keys))), keys).fetchall()
+        finally:
+            connection.close()
+    return dict(rows)
+
+def _store(entries):
+    with _db_guard:
+        connection = _connect()
+        try:
+            with connection:
+                connection.executemany('INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?)', entries)
+        finally:
+            connection.close()
+
+def batches(texts):
+    # Split texts into requests within Translator's per-request element and character limits
+    batch = []
+    batch_chars = 0
+    for text in texts:
+        if batch and (len(batch) >= MAX_BATCH_TEXTS or batch_chars + len(text) > MAX_BATCH_CHARS):
+            yield batch
+            batch = []
+            batch_chars = 0
+        batch.append(text)
+        batch_chars += len(text)
+    if batch:
+        yield batch
+
+def translate(text_list, from_lang, to_lang, translate_batch):
+    # translate_batch(texts) does the actual (uncached) request and returns translations in order
+    keys = [cache_key(text, from_lang, to_lang) for text in text_list]
+    try:
+        cached = _lookup(list(set(keys)))
+    except sqlite3.Error as ex:
+        logger.info('Translation cache unavailable, translating everything.')
+        logger.exception(ex)
+        cached = {}
+
+    # Dedupe misses so a repeated string is only sent once
+    misses = {}
+    for key, text in zip(keys, text_list):
+        if key not in cached and key not in misses:
+            misses[key] = normalize(text)
+    logger.info('Translation cache: %s hits, %s misses.', len(text_list) - len(misses), len(misses))
+
+    miss_keys = list(misses)
+    translated = []
+    for batch in batches([misses[key] for key in miss_keys]):
+        translated.extend(translate_batch(batch))
+
+    entries = []
+    now = time.time()
+    for key, translation in zip(miss_keys, translated):
+        cached[key] = translation
+        entries.append((key, from_lang, to_lang, misses[key], translation, now))
+    if entries:
+        try:
+            _store(entries)
+        except sqlite3.Error as ex:
+            logger.info('Could not write to translation cache.')
+            logger.exception(ex)
+
+    return [cached[key] for key in keys]
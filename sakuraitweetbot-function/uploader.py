@@ -0,0 +1,86 @@
+import os
+import time
+import random
+import logging
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from .settings import config
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = config.getint('Imgur', 'MAX_ATTEMPTS')
+UPLOAD_WORKERS = config.getint('Imgur', 'UPLOAD_WORKERS')
+BACKOFF_BASE = config.getfloat('Imgur', 'BACKOFF_BASE')
+BACKOFF_MAX = config.getfloat('Imgur', 'BACKOFF_MAX')
+
+class UploadError(Exception):
+    pass
+
+def _parse_retry_after(value):
+    # Retry-After is either delta-seconds or an HTTP date
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def retry_delay(response, attempt):
+    # Prefer what the server tells us, fall back to full-jitter exponential backoff
+    headers = response.headers if response is not None else {}
+
+    if headers.get('Retry-After'):
+        delay = _parse_retry_after(headers['Retry-After'])
+        if delay is not None:
+            return min(delay, BACKOFF_MAX)
+
+    if headers.get('X-Post-Rate-Limit-Remaining') == '0' and headers.get('X-Post-Rate-Limit-Reset'):
+        return min(float(headers['X-Post-Rate-Limit-Reset']), BACKOFF_MAX) # seconds until reset
+
+    if headers.get('X-RateLimit-UserRemaining') == '0' and headers.get('X-RateLimit-UserReset'):
+        return min(max(0.0, float(headers['X-RateLimit-UserReset']) - time.time()), BACKOFF_MAX) # unix timestamp
+
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+def _is_retryable(response):
+    return response is None or response.status_code == 429 or response.status_code >= 500
+
+def upload_with_retries(upload_fn, label):
+    # upload_fn performs one attempt and returns the requests.Response
+    for i in range(0, MAX_ATTEMPTS):
+        response = None
+        json = None
+        try:
+            response = upload_fn()
+            json = response.json()
+        except Exception as ex:
+            logger.info('Error during %s, attempt #%s: %s', label, i + 1, ex) # 1-index attempts
+
+        logger.debug('JSON for %s, attempt #%s:\n%s', label, i + 1, json) # 1-index attempts
+        if json and json.get('success'):
+            return json['data']
+
+        if response is not None and json is not None and not _is_retryable(response):
+            raise UploadError('{} failed with non-retryable status {}: {}'.format(label, response.status_code, json))
+
+        if i == MAX_ATTEMPTS - 1:
+            break
+
+        delay = retry_delay(response, i)
+        logger.info('Failed %s, attempt #%s, retrying in %.1fs... (%s max attempts)', label, i + 1, delay, MAX_ATTEMPTS) # 1-index attempts
+        if os.environ['SLEEP_MODE'] == 'True':
+            time.sleep(delay)
+
+    logger.warning('Failed %s after %s attempts. Terminating.', label, MAX_ATTEMPTS)
+    raise UploadError('{} failed after {} attempts'.format(label, MAX_ATTEMPTS))
+
+def upload_all(upload_fns):
+    # Run every upload concurrently (bounded), results come back in the order of upload_fns
+    if not upload_fns:
+        return []
+    workers = max(1, min(UPLOAD_WORKERS, len(upload_fns)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda upload_fn: upload_fn(), upload_fns))
@@ -0,0 +1,78 @@
+import os
+import stat
+import shutil
+import logging
+import functools
+
+from PIL import Image
+import ffmpeg
+
+from .settings import parent, config
+
+logger = logging.getLogger(__name__)
+
+# FFMPEG path (PathLike)
+FFMPEG_PATH = parent / '../bin/ffmpeg-git-20200504-amd64-static/ffmpeg'
+TMP_FFMPEG_PATH = "/tmp/ffmpeg"
+
+FRAME_SECONDS = config.getfloat('Video', 'FRAME_SECONDS')
+OUTPUT_FPS = config.getint('Video', 'OUTPUT_FPS')
+MAX_DIMENSION = config.getint('Video', 'MAX_DIMENSION')
+
+@functools.lru_cache(maxsize=None)
+def ffmpeg_binary():
+    # Once per process: the packaged static build is read-only, copy it to /tmp and make it executable
+    if FFMPEG_PATH.exists():
+        if not os.path.exists(TMP_FFMPEG_PATH) or os.path.getsize(TMP_FFMPEG_PATH) != FFMPEG_PATH.stat().st_size:
+            shutil.copyfile(FFMPEG_PATH, TMP_FFMPEG_PATH)
+        os.chmod(TMP_FFMPEG_PATH, os.stat(TMP_FFMPEG_PATH).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        logger.info('Using ffmpeg binary %s.', TMP_FFMPEG_PATH)
+        return TMP_FFMPEG_PATH
+    logger.info('Packaged ffmpeg not found, using ffmpeg from PATH.')
+    return shutil.which('ffmpeg') or 'ffmpeg'
+
+def frame_size(media):
+    # Size of the first image, scaled down to MAX_DIMENSION and rounded to even numbers (needed for yuv420p)
+    with Image.open(media.open()) as image:
+        width, height = image.size
+    scale = min(1.0, MAX_DIMENSION / max(width, height))
+    return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
+
+def load_frame(media, size):
+    # Decode at reduced resolution where possible, fit into size keeping aspect ratio, pad with black
+    with Image.open(media.open()) as image:
+        image.draft('RGB', size) # JPEG only: lets the decoder downscale by 1/2, 1/4, 1/8 for free
+        image = image.convert('RGB')
+        image.thumbnail(size, Image.LANCZOS)
+        if image.size == size:
+            return image
+        frame = Image.new('RGB', size)
+        frame.paste(image, ((size[0] - image.size[0]) // 2, (size[1] - image.size[1]) // 2))
+        return frame
+
+def build_video(media_list, video_fp):
+    # Frames are piped to ffmpeg's stdin as raw RGB, no intermediate image files
+    size = frame_size(media_list[0])
+    process = (
+        ffmpeg
+        .input('pipe:', format='rawvideo', pix_fmt='rgb24', s='{}x{}'.format(*size), framerate=1 / FRAME_SECONDS)
+        .output(str(video_fp), pix_fmt='yuv420p', vcodec='libx264', r=OUTPUT_FPS)
+        .global_args('-loglevel', 'error')
+        .overwrite_output()
+        .run_async(cmd=ffmpeg_binary(), pipe_stdin=True, pipe_stdout=True, pipe_stderr=True)
+    )
+
+    for media in media_list:
+        process.stdin.write(load_frame(media, size).tobytes())
+        logger.info('Encoded frame %r.', media)
+
+    # Black frame for end of video (hypothesizing Reddit cuts last still frame in video)
+    process.stdin.write(Image.new('RGB', size).tobytes())
+
+    out, err = process.communicate() # closes stdin
+    logger.info('ffmpeg stdout: %s', out)
+    logger.info('ffmpeg stderr: %s', err)
+    if process.returncode != 0:
+        raise ffmpeg.Error('ffmpeg', out, err)
+
+    return video_fp
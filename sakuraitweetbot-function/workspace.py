@@ -0,0 +1,202 @@
+import io
+import os
+import time
+import shutil
+import pathlib
+import logging
+import tempfile
+import threading
+
+from .settings import config
+
+logger = logging.getLogger(__name__)
+
+SCRATCH_DIR = pathlib.Path(config['Media']['SCRATCH_DIR'])
+SPOOL_MAX_BYTES = config.getint('Media', 'SPOOL_MAX_BYTES')
+MEMORY_BUDGET_BYTES = config.getint('Media', 'MEMORY_BUDGET_BYTES')
+SCRATCH_MAX_AGE_HOURS = config.getfloat('Media', 'SCRATCH_MAX_AGE_HOURS')
+
+class MemoryBudget:
+    # Bytes of media a run may hold in memory, shared by all of its jobs
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def reserve(self, num_bytes):
+        with self.lock:
+            if self.used + num_bytes > self.limit:
+                return False
+            self.used += num_bytes
+            return True
+
+    def release(self, num_bytes):
+        with self.lock:
+            self.used -= num_bytes
+
+def link_or_copy(source_fp, dest_fp):
+    # Hard link where possible (no copy, and the file survives its source being evicted/removed), copy otherwise
+    part_fp = '{}.part'.format(dest_fp)
+    try:
+        os.link(source_fp, part_fp)
+    except OSError:
+        shutil.copyfile(source_fp, part_fp)
+    os.replace(part_fp, dest_fp)
+
+class Media:
+    # One media file of a workspace. Held in memory while it fits SPOOL_MAX_BYTES and the run's memory budget,
+    # spilled to a file in the workspace directory beyond that, or as soon as a caller needs a path (praw, ffmpeg).
+    # Written by one thread, then read concurrently (e.g. imgur upload next to the reddit gallery submit): the lock
+    # makes a spill atomic for readers, _path is only set once the file is complete and closed
+    def __init__(self, workspace, name):
+        self.workspace = workspace
+        self.name = name
+        self.size = 0
+        self._buffer = io.BytesIO()
+        self._path = None
+        self._file = None # spill file while still writing
+        self._lock = threading.Lock()
+
+    def _target(self):
+        return self.workspace.dir / self.name
+
+    def write(self, data):
+        with self._lock:
+            if self._file is None:
+                if self.size + len(data) <= SPOOL_MAX_BYTES and self.workspace.budget.reserve(len(data)):
+                    self._buffer.write(data)
+                    self.size += len(data)
+                    return
+                self._file = open(self._target(), 'wb')
+                self._file.write(self._buffer.getbuffer())
+                self._release_buffer()
+            self._file.write(data)
+            self.size += len(data)
+
+    def close(self):
+        # Done writing
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self._path = self._target()
+
+    def _release_buffer(self):
+        self.workspace.budget.release(self._buffer.tell())
+        self._buffer = None
+
+    def in_memory(self):
+        with self._lock:
+            return self._buffer is not None
+
+    def path(self):
+        with self._lock:
+            if self._path is None:
+                with open(self._target(), 'wb') as f:
+                    f.write(self._buffer.getbuffer())
+                self._path = self._target()
+                self._release_buffer()
+                logger.debug('Spilled %s to %s for a path.', self.name, self._path)
+            return self._path
+
+    def open(self):
+        # A new reader each call (e.g. one per upload attempt), from memory while the buffer is held
+        with self._lock:
+            if self._buffer is not None:
+                return io.BytesIO(self._buffer.getvalue())
+            return open(self._path, 'rb')
+
+    def persist(self, dest_fp):
+        # Copy into a cache outside the workspace (atomically); a spilled file is hard linked instead of copied.
+        # An in-memory one is written to the cache once and that file is linked back as its path, so a caller that
+        # needs a path (praw, ffmpeg) doesn't cost a second write; readers still get the buffer
+        dest_fp.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            if self._path is not None:
+                link_or_copy(self._path, dest_fp)
+                return
+            part_fp = '{}.part'.format(dest_fp)
+            with open(part_fp, 'wb') as f:
+                f.write(self._buffer.getbuffer())
+            os.replace(part_fp, dest_fp)
+            link_or_copy(dest_fp, self._target())
+            self._path = self._target()
+
+    def discard(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self._buffer is not None:
+                self._release_buffer()
+            self._path = None
+
+    def __repr__(self):
+        return '<Media {} ({} bytes, {})>'.format(self.name, self.size, 'memory' if self._buffer is not None else self._path)
+
+class Workspace:
+    # Scratch space of one run or one job within it: a private directory plus the run's memory budget.
+    # Nothing outside of it is touched, so overlapping invocations can't step on each other's files
+    def __init__(self, directory, budget):
+        self.dir = directory
+        self.budget = budget
+        self.media = []
+        self.children = []
+        self.lock = threading.Lock()
+
+    def new_media(self, name):
+        media = Media(self, name)
+        with self.lock:
+            self.media.append(media)
+        return media
+
+    def adopt(self, name, source_fp):
+        # Media for a file that already exists (a cache entry), linked into the workspace so it stays valid for the job
+        media = Media(self, name)
+        link_or_copy(source_fp, media._target())
+        media._path = media._target()
+        media._release_buffer()
+        media.size = os.path.getsize(media._path)
+        with self.lock:
+            self.media.append(media)
+        return media
+
+    def path(self, name):
+        # For outputs that are files anyway (ffmpeg's video)
+        return self.dir / name
+
+    def job(self, name):
+        child = Workspace(pathlib.Path(tempfile.mkdtemp(prefix='{}-'.format(name), dir=str(self.dir))), self.budget)
+        with self.lock:
+            self.children.append(child)
+        return child
+
+    def cleanup(self):
+        with self.lock:
+            children, self.children = self.children, []
+            media, self.media = self.media, []
+        for child in children:
+            child.cleanup()
+        for item in media:
+            item.discard()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+def sweep(max_age_hours=SCRATCH_MAX_AGE_HOURS):
+    # Run directories are removed when their run ends; this only catches runs whose process was killed
+    if not SCRATCH_DIR.exists():
+        return
+    cutoff = time.time() - max_age_hours * 60 * 60
+    for run_dir in SCRATCH_DIR.iterdir():
+        try:
+            if run_dir.stat().st_mtime < cutoff:
+                shutil.rmtree(run_dir)
+                logger.info('Removed stale scratch directory: %s', run_dir)
+        except Exception as ex:
+            logger.info('Error while removing stale scratch directory: %s', run_dir)
+            logger.exception(ex)
+
+def new_run():
+    SCRATCH_DIR.mkdir(parents=True, exist_ok=True)
+    run = Workspace(pathlib.Path(tempfile.mkdtemp(prefix='run-', dir=str(SCRATCH_DIR))), MemoryBudget(MEMORY_BUDGET_BYTES))
+    logger.info('Run workspace: %s', run.dir)
+    return run
@@ -0,0 +1,42 @@
+import os
+import sys
+import types
+import pathlib
+import tempfile
+
+import pytest
+
+# Load the function package without its azure.functions entry point, like bench/env.py does. The bot reads its
+# environment and config into module constants at import, so this has to happen before any test imports it
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+FUNCTION_DIR = ROOT / 'sakuraitweetbot-function'
+PACKAGE = 'sakuraitweetbot_function'
+
+ENVIRONMENT = {'TEST_MODE': 'True',
+               'SLEEP_MODE': 'False',
+               'IMGUR_ACCESS_TOKEN': 'test',
+               'IMGUR_ALBUM_ID': 'testalbum',
+               'AZURE_TRANSLATOR_API_KEY': 'test',
+               'AZURE_REGION': 'test',
+               'TWITTER_CONSUMER_KEY': 'test',
+               'TWITTER_CONSUMER_SECRET': 'test',
+               'REDDIT_CLIENT_ID': 'test',
+               'REDDIT_CLIENT_SECRET': 'test',
+               'REDDIT_USER_AGENT': 'test',
+               'REDDIT_USERNAME': 'test',
+               'REDDIT_PASSWORD': 'test'}
+
+os.environ.update(ENVIRONMENT, SAKURAI_DATA_DIR=tempfile.mkdtemp(prefix='sakuraitweetbot-tests-'))
+package = types.ModuleType(PACKAGE)
+package.__path__ = [str(FUNCTION_DIR)]
+sys.modules[PACKAGE] = package
+
+@pytest.fixture
+def scratch(tmp_path):
+    # A workspace of its own per test, media held in memory up to the configured budget
+    from sakuraitweetbot_function import workspace
+    run = workspace.Workspace(tmp_path / 'scratch', workspace.MemoryBudget(workspace.MEMORY_BUDGET_BYTES))
+    run.dir.mkdir()
+    yield run
+    run.cleanup()
@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+from sakuraitweetbot_function import album
+
+# In-memory imgur album: the calls album.update makes, and what the album looks like after them
+class FakeAlbum:
+    def __init__(self, image_ids=()):
+        self.image_ids = list(image_ids)
+        self.cover = None
+        self.calls = []
+
+    def fetch(self):
+        self.calls.append('fetch')
+        return list(self.image_ids)
+
+    def set_album(self, image_ids, cover):
+        self.calls.append('set')
+        self.image_ids = list(image_ids)
+        self.cover = cover
+
+    def update(self, image_ids):
+        return album.update('album', image_ids, self.fetch, self.set_album)
+
+@pytest.fixture(autouse=True)
+def index_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(album, 'INDEX_PATH', tmp_path / 'imgur_album.json')
+
+def test_first_update_reads_then_writes_newest_first():
+    remote = FakeAlbum(['c', 'b', 'a'])
+    remote.update(['d'])
+    assert remote.calls == ['fetch', 'set']
+    assert remote.image_ids == ['d', 'c', 'b', 'a']
+    assert remote.cover == 'd'
+
+def test_daily_updates_write_once_without_reading():
+    remote = FakeAlbum(['b', 'a'])
+    remote.update(['c'])
+    remote.calls = []
+    for day in ['d', 'e', 'f']:
+        remote.update([day])
+    assert remote.calls == ['set', 'set', 'set']
+    assert remote.image_ids == ['f', 'e', 'd', 'c', 'b', 'a']
+    assert remote.cover == 'f'
+
+def test_up_to_date_album_is_not_written():
+    remote = FakeAlbum(['b', 'a'])
+    remote.update(['b'])
+    remote.calls = []
+    remote.update(['b'])
+    assert remote.calls == []
+
+def test_stale_index_only_rewrites_a_drifted_album(monkeypatch):
+    remote = FakeAlbum(['b', 'a'])
+    remote.update(['c'])
+    remote.calls = []
+    monkeypatch.setattr(album, 'RECONCILE_DAYS', 0)
+    time.sleep(0.01)
+
+    remote.update([])
+    assert remote.calls == ['fetch'] # still in the order the index has
+
+    remote.image_ids = ['c', 'a', 'b', 'x'] # reordered, and one image added, outside of the bot
+    remote.calls = []
+    remote.update([])
+    assert remote.calls == ['fetch', 'set']
+    assert remote.image_ids == ['c', 'b', 'a', 'x']
+
+def test_unconfirmed_write_is_reconciled():
+    remote = FakeAlbum(['a'])
+
+    def failing_set(image_ids, cover):
+        raise album.AlbumError('imgur is down')
+    with pytest.raises(album.AlbumError):
+        album.update('album', ['b'], remote.fetch, failing_set)
+    assert album.load_index('album')['dirty']
+
+    remote.calls = []
+    remote.update(['b'])
+    assert remote.calls == ['fetch', 'set']
+    assert remote.image_ids == ['b', 'a']
+    assert not album.load_index('album')['dirty']
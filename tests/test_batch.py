@@ -0,0 +1,45 @@
+import time
+import threading
+
+from sakuraitweetbot_function import batch
+
+def test_run_jobs_keeps_order_and_isolates_failures():
+    def job_fn(job):
+        if job == 2:
+            raise ValueError(job)
+        time.sleep(0.01 * (5 - job)) # later jobs finish first
+        return job * 10
+    results = batch.run_jobs([0, 1, 2, 3, 4], job_fn, max_workers=5)
+    assert [(job, result) for job, result, ex in results] == [(0, 0), (1, 10), (2, None), (3, 30), (4, 40)]
+    assert [type(ex) for job, result, ex in results] == [type(None)] * 2 + [ValueError] + [type(None)] * 2
+
+def test_turnstile_lets_jobs_through_in_order():
+    keys = ['a', 'b', 'c', 'd']
+    turnstile = batch.Turnstile(keys)
+    entered = []
+
+    def job_fn(key):
+        time.sleep(0.01 * (4 - keys.index(key))) # reach the turnstile in reverse order
+        if key == 'b':
+            turnstile.done(key) # e.g. failed before submitting
+            return
+        with turnstile.turn(key):
+            entered.append(key)
+
+    batch.run_jobs(keys, job_fn, max_workers=4)
+    assert entered == ['a', 'c', 'd']
+
+def test_turnstile_done_is_idempotent():
+    turnstile = batch.Turnstile(['a', 'b'])
+    with turnstile.turn('a'):
+        pass
+    turnstile.done('a')
+    waited = threading.Event()
+
+    def enter():
+        with turnstile.turn('b'):
+            waited.set()
+    thread = threading.Thread(target=enter)
+    thread.start()
+    thread.join(1)
+    assert waited.is_set()
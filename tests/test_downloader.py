@@ -0,0 +1,102 @@
+import threading
+import collections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from sakuraitweetbot_function import downloader
+
+# Stand-in for pbs.twimg.com: /media/<name> serves bytes derived from the name, /status/<code> fails with that code
+class MediaHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        with self.server.guard:
+            self.server.requests[path] += 1
+        if path.startswith('/status/'):
+            self.send_error(int(path.rsplit('/', 1)[1]))
+            return
+        body = media_bytes(path)
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def media_bytes(path):
+    return path.encode('utf-8') * 1000
+
+@pytest.fixture
+def media_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MediaHandler)
+    server.guard = threading.Lock()
+    server.requests = collections.Counter()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(downloader, 'CACHE_DIR', tmp_path / 'cache')
+    return tmp_path / 'cache'
+
+def media_url(server, path):
+    return 'http://127.0.0.1:{}{}?format=jpg&name=4096x4096'.format(server.server_port, path)
+
+def read(media):
+    with media.open() as f:
+        return f.read()
+
+def test_each_url_fetched_once(media_server, scratch):
+    urls = [media_url(media_server, '/media/{}'.format(idx)) for idx in range(4)]
+    downloader.download_all(urls + urls, scratch)
+    assert media_server.requests == {'/media/{}'.format(idx): 1 for idx in range(4)}
+
+    # A later run is served from the cache
+    downloader.download_all(urls, scratch.job('rerun'))
+    assert sum(media_server.requests.values()) == 4
+
+def test_repeated_urls_keep_order(media_server, scratch):
+    paths = ['/media/a', '/media/b', '/media/a', '/media/c', '/media/b']
+    media = downloader.download_all([media_url(media_server, path) for path in paths], scratch)
+    assert [read(item) for item in media] == [media_bytes(path) for path in paths]
+    assert media[0] is media[2]
+
+def test_cache_hit_matches_download(media_server, scratch, cache_dir):
+    url = media_url(media_server, '/media/a')
+    first, = downloader.download_all([url], scratch)
+    second, = downloader.download_all([url], scratch.job('rerun'))
+    assert read(first) == read(second) == media_bytes('/media/a')
+    assert list(cache_dir.iterdir()) == [downloader.cache_path(url)]
+
+@pytest.mark.parametrize('status', [404, 500])
+def test_download_failure_propagates(media_server, scratch, cache_dir, status):
+    urls = [media_url(media_server, '/media/a'), media_url(media_server, '/status/{}'.format(status))]
+    with pytest.raises(requests.HTTPError):
+        downloader.download_all(urls, scratch)
+    # Nothing half written is left for the next run to pick up
+    assert not downloader.cache_path(urls[1]).exists()
+    assert not list(cache_dir.glob('*.part'))
+
+def test_eviction_keeps_current_batch(media_server, scratch, cache_dir, monkeypatch):
+    monkeypatch.setattr(downloader, 'CACHE_MAX_BYTES', 1)
+    old = media_url(media_server, '/media/old')
+    downloader.download_all([old], scratch)
+    new = [media_url(media_server, '/media/new-{}'.format(idx)) for idx in range(2)]
+    downloader.download_all(new, scratch.job('next'))
+    assert not downloader.cache_path(old).exists()
+    assert all(downloader.cache_path(url).exists() for url in new)
+
+def test_downloaded_media_path_is_the_cache_entry(media_server, scratch, cache_dir):
+    url = media_url(media_server, '/media/a')
+    media, = downloader.download_all([url], scratch)
+    assert media.in_memory()
+    # A path for praw/ffmpeg is a link to the file already written to the cache, not a second copy
+    assert media.path().stat().st_ino == downloader.cache_path(url).stat().st_ino
+    assert media.path().parent == scratch.dir
+    assert read(media) == media_bytes('/media/a')
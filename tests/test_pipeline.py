@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+
+from sakuraitweetbot_function import pipeline
+
+# A fake post graph with the shape of sakuraitweetbot.thread_stages: every stage records that it ran and returns its name
+GRAPH = {
+    'download': [],
+    'prepare': ['download'],
+    'imgur_upload': ['prepare'],
+    'translate': [],
+    'render_comment': ['translate'],
+    'submit': ['prepare'], # a gallery, submitted to reddit directly
+    'reply': ['submit', 'render_comment'],
+    'moderate_submission': ['submit'],
+    'moderate_reply': ['reply'],
+}
+
+def fake_stages(graph=GRAPH, failing=()):
+    ran = []
+    guard = threading.Lock()
+
+    def stage_fn(name):
+        def fn(results):
+            with guard:
+                ran.append(name)
+            if name in failing:
+                raise RuntimeError('{} failed'.format(name))
+            return name
+        return fn
+    return [pipeline.Stage(name, stage_fn(name), deps) for name, deps in graph.items()], ran
+
+def test_runs_every_stage_after_its_deps():
+    stages, ran = fake_stages()
+    results, timings = pipeline.run_stages(stages, max_workers=4)
+    assert set(results) == set(GRAPH) == set(timings)
+    for name, deps in GRAPH.items():
+        assert all(ran.index(dep) < ran.index(name) for dep in deps)
+
+def test_done_stages_and_what_only_they_need_are_skipped():
+    stages, ran = fake_stages()
+    done = {'imgur_upload': 'imgur', 'submit': 'submission'}
+    assert pipeline.skipped_stages({stage.name: stage for stage in stages}, done) == {'imgur_upload', 'submit', 'download', 'prepare'}
+
+    results, _ = pipeline.run_stages(stages, done=done)
+    assert sorted(ran) == ['moderate_reply', 'moderate_submission', 'render_comment', 'reply', 'translate']
+    assert results['submit'] == 'submission'
+
+def test_shared_dependency_still_runs_while_one_dependent_is_left():
+    stages, _ = fake_stages()
+    skipped = pipeline.skipped_stages({stage.name: stage for stage in stages}, {'submit': 'submission'})
+    assert 'prepare' not in skipped and 'download' not in skipped # imgur_upload still needs them
+
+def test_stages_without_dependents_are_only_skipped_when_done():
+    stages, _ = fake_stages()
+    everything_but_moderation = {name: name for name in GRAPH if not name.startswith('moderate')}
+    skipped = pipeline.skipped_stages({stage.name: stage for stage in stages}, everything_but_moderation)
+    assert 'moderate_submission' not in skipped and 'moderate_reply' not in skipped
+
+def test_failure_only_stops_its_downstream_and_is_reraised():
+    graph = dict(GRAPH, album_update=['imgur_upload'])
+    stages, ran = fake_stages(graph, failing={'imgur_upload'})
+    with pytest.raises(RuntimeError, match='imgur_upload failed'):
+        pipeline.run_stages(stages)
+    assert {'submit', 'reply', 'moderate_submission', 'moderate_reply'} <= set(ran)
+    assert 'album_update' not in ran
+
+def test_first_failure_is_reraised():
+    graph = {'a': [], 'b': ['a'], 'c': []}
+    stages, ran = fake_stages(graph, failing={'a'})
+    with pytest.raises(RuntimeError, match='a failed'):
+        pipeline.run_stages(stages, max_workers=1)
+    assert 'b' not in ran and 'c' in ran
+
+def test_cycle_and_unknown_deps_are_errors():
+    stages, _ = fake_stages({'a': ['b'], 'b': ['a']})
+    with pytest.raises(pipeline.StageError):
+        pipeline.run_stages(stages)
+    stages, _ = fake_stages({'a': ['missing']})
+    with pytest.raises(pipeline.StageError):
+        pipeline.run_stages(stages)
@@ -0,0 +1,127 @@
+import threading
+from types import SimpleNamespace
+from datetime import datetime
+
+import pytest
+
+from sakuraitweetbot_function import sakuraitweetbot as bot
+from sakuraitweetbot_function import batch
+from sakuraitweetbot_function import journal
+from sakuraitweetbot_function import pipeline
+from sakuraitweetbot_function.threads import Thread
+
+TARGET = 'sakuraitweetbot_test'
+
+def make_thread(num_images, text_list=('今日の一枚',)):
+    media_urls = ['https://pbs.twimg.com/media/img{}.jpg?format=jpg&name=4096x4096'.format(idx) for idx in range(num_images)]
+    return Thread('https://twitter.com/Sora_Sakurai/status/1580002', media_urls, list(text_list), datetime(2022, 10, 13, 1, 30), [1580002, 1580003])
+
+# Every outside effect of post_thread replaced by a recorder: steps lists what ran, fail makes a step raise
+class FakeServices:
+    def __init__(self):
+        self.steps = []
+        self.fail = set()
+        self.guard = threading.Lock()
+
+    def step(self, name, result):
+        with self.guard:
+            self.steps.append(name)
+        if name in self.fail:
+            raise RuntimeError('{} failed'.format(name))
+        return result
+
+@pytest.fixture
+def services(tmp_path, monkeypatch):
+    fake = FakeServices()
+    monkeypatch.setattr(journal, 'JOURNAL_PATH', tmp_path / 'journal.sqlite3')
+    monkeypatch.setattr(bot.downloader, 'download_all', lambda urls, scratch: fake.step('download', ['media{}'.format(idx) for idx in range(len(urls))]))
+    monkeypatch.setattr(bot.imaging, 'prepare_all', lambda media, scratch: fake.step('prepare', media))
+    monkeypatch.setattr(bot, 'upload_images_to_imgur', lambda media, title, url: fake.step('imgur_upload', [('img{}'.format(idx), 'https://i.imgur.com/img{}.jpg'.format(idx)) for idx in range(len(media))]))
+    monkeypatch.setattr(bot, 'translate_text', lambda texts: fake.step('translate', ['Pic of the day'] * len(texts)))
+    monkeypatch.setattr(bot, 'submit_thread', lambda subreddit, title, media, uploads: fake.step('submit', SimpleNamespace(id='sub1')))
+    monkeypatch.setattr(bot, 'create_reddit_comment', lambda submission, comment: fake.step('reply', SimpleNamespace(id='com1', submission=submission)))
+    monkeypatch.setattr(bot, 'moderate_submission', lambda submission: fake.step('moderate_submission', None))
+    monkeypatch.setattr(bot, 'moderate_reply', lambda reply: fake.step('moderate_reply', None))
+    # Resumed submissions/comments are rebuilt from their ids through the reddit client
+    reddit = SimpleNamespace(submission=lambda id: SimpleNamespace(id=id), comment=lambda id: SimpleNamespace(id=id))
+    monkeypatch.setattr(bot.clients, 'reddit', lambda: reddit)
+    return fake
+
+def post(thread, scratch):
+    return bot.post_thread(TARGET, thread, scratch, batch.Turnstile([str(thread.tweet_ids[0])]))
+
+def recorded(thread):
+    return journal.load(str(thread.tweet_ids[0]), TARGET)
+
+def test_first_run_journals_every_step(services, scratch):
+    thread = make_thread(1)
+    submission, reply, image_uploads = post(thread, scratch)
+    assert (submission.id, reply.id) == ('sub1', 'com1')
+    assert image_uploads == [('img0', 'https://i.imgur.com/img0.jpg')]
+    assert recorded(thread) == {'imgur_upload': [['img0', 'https://i.imgur.com/img0.jpg']], 'submit': 'sub1', 'reply': 'com1',
+                                'moderate_submission': True, 'moderate_reply': True}
+
+def test_resume_after_submit_runs_only_reply_and_moderation(services, scratch):
+    thread = make_thread(1)
+    key = str(thread.tweet_ids[0])
+    journal.record(key, TARGET, 'imgur_upload', [['img0', 'https://i.imgur.com/img0.jpg']])
+    journal.record(key, TARGET, 'submit', 'sub1')
+
+    submission, reply, image_uploads = post(thread, scratch)
+    # download/prepare are only needed by steps already done, translate feeds the comment
+    assert sorted(services.steps) == ['moderate_reply', 'moderate_submission', 'reply', 'translate']
+    assert submission.id == 'sub1'
+    assert image_uploads == [('img0', 'https://i.imgur.com/img0.jpg')] # not in the album yet
+
+def test_crashed_run_is_resumed_without_reposting(services, scratch):
+    thread = make_thread(1)
+    services.fail = {'reply'}
+    with pytest.raises(RuntimeError, match='reply failed'):
+        post(thread, scratch)
+    assert 'submit' in recorded(thread)
+
+    services.fail = set()
+    services.steps = []
+    post(thread, scratch)
+    assert 'submit' not in services.steps and 'imgur_upload' not in services.steps
+    assert sorted(services.steps) == ['moderate_reply', 'reply', 'translate']
+
+def test_done_post_does_nothing_and_keeps_album_state(services, scratch):
+    thread = make_thread(1)
+    post(thread, scratch)
+    journal.record(str(thread.tweet_ids[0]), TARGET, 'album_update', True)
+    services.steps = []
+    submission, reply, image_uploads = post(thread, scratch)
+    assert services.steps == []
+    assert image_uploads is None
+
+def test_download_and_prepare_skipped_once_their_users_are_done(services, scratch):
+    for thread, done in [(make_thread(1), {'imgur_upload', 'submit'}), (make_thread(4), {'imgur_upload', 'submit'})]:
+        stages = {stage.name: stage for stage in bot.thread_stages(TARGET, thread, scratch, batch.Turnstile([]))}
+        assert {'download', 'prepare'} <= pipeline.skipped_stages(stages, done)
+
+    # A gallery is submitted from the prepared images, so they are still needed until imgur is done too
+    stages = {stage.name: stage for stage in bot.thread_stages(TARGET, make_thread(4), scratch, batch.Turnstile([]))}
+    assert 'prepare' not in pipeline.skipped_stages(stages, {'submit'})
+
+def test_failed_imgur_upload_still_replies_to_a_gallery(services, scratch):
+    thread = make_thread(4)
+    services.fail = {'imgur_upload'}
+    with pytest.raises(RuntimeError, match='imgur_upload failed'):
+        post(thread, scratch)
+    assert {'submit', 'reply', 'moderate_submission', 'moderate_reply'} <= set(services.steps)
+    assert set(recorded(thread)) == {'submit', 'reply', 'moderate_submission', 'moderate_reply'}
+
+    # The retry only has the upload left to do
+    services.fail = set()
+    services.steps = []
+    submission, reply, image_uploads = post(thread, scratch)
+    assert sorted(services.steps) == ['download', 'imgur_upload', 'prepare']
+    assert len(image_uploads) == 4
+
+def test_single_image_is_not_submitted_without_its_imgur_link(services, scratch):
+    thread = make_thread(1)
+    services.fail = {'imgur_upload'}
+    with pytest.raises(RuntimeError, match='imgur_upload failed'):
+        post(thread, scratch)
+    assert 'submit' not in services.steps
@@ -0,0 +1,117 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from sakuraitweetbot_function import ratelimit
+from sakuraitweetbot_function import reddit_writer
+
+# praw's RedditAPIException carries a list of items with error_type and message, APIException is a single item
+class RedditAPIException(Exception):
+    def __init__(self, *items):
+        super().__init__(items)
+        self.items = [SimpleNamespace(error_type=error_type, message=message) for error_type, message in items]
+
+class APIException(Exception):
+    def __init__(self, error_type, message):
+        super().__init__(message)
+        self.error_type = error_type
+        self.message = message
+
+def ratelimited(message):
+    return RedditAPIException(('RATELIMIT', message))
+
+@pytest.mark.parametrize('message, delay', [
+    ("Looks like you've been doing that a lot. Take a break for 5 minutes before trying again.", 300),
+    ("Looks like you've been doing that a lot. Take a break for 1 minute before trying again.", 60),
+    ("Looks like you've been doing that a lot. Take a break for 42 seconds before trying again.", 42),
+    ("Looks like you've been doing that a lot. Take a break for 750 milliseconds before trying again.", 0.75),
+    ("Looks like you've been doing that a lot.", 60.0), # no number: a minute
+])
+def test_ratelimit_delay_parsing(message, delay):
+    assert reddit_writer.ratelimit_delay(ratelimited(message)) == pytest.approx(delay)
+
+def test_ratelimit_delay_finds_the_ratelimit_item():
+    ex = RedditAPIException(('SUBMIT_VALIDATION_FLAIR_REQUIRED', 'flair required'), ('RATELIMIT', 'Take a break for 3 seconds'))
+    assert reddit_writer.ratelimit_delay(ex) == 3
+    assert reddit_writer.ratelimit_delay(APIException('RATELIMIT', 'Take a break for 2 minutes')) == 120
+
+@pytest.mark.parametrize('ex', [RedditAPIException(('ALREADY_SUB', 'that link has already been submitted')),
+                                APIException('USER_REQUIRED', 'please log in'), ValueError('boom')])
+def test_ratelimit_delay_none_for_other_errors(ex):
+    assert reddit_writer.ratelimit_delay(ex) is None
+
+def test_token_bucket_waits_for_refill():
+    bucket = ratelimit.TokenBucket(rate=100, capacity=2)
+    assert bucket.acquire() == 0 and bucket.acquire() == 0
+    start = time.monotonic()
+    waited = bucket.acquire()
+    assert waited > 0 and time.monotonic() - start >= 0.005
+
+def test_governor_follows_remaining_quota():
+    governor = ratelimit.RateGovernor(rate=10, capacity=30)
+    governor.update(remaining=60, reset=600)
+    assert governor.rate == pytest.approx(0.1)
+    governor.update(remaining=5, reset=600)
+    assert governor.tokens <= 5
+    governor.update(remaining=6000, reset=60)
+    assert governor.rate == 10 # never above the configured rate
+
+def test_governor_pauses_when_quota_is_used_up():
+    governor = ratelimit.RateGovernor(rate=1000, capacity=10)
+    governor.update(remaining=0, reset=0.1) # paused for at least a second
+    assert governor.paused_until - time.monotonic() == pytest.approx(1.0, abs=0.05)
+
+    governor = ratelimit.RateGovernor(rate=1000, capacity=10)
+    governor.pause(0.05)
+    governor.pause(0.01) # a shorter pause doesn't cut the longer one short
+    start = time.monotonic()
+    governor.acquire()
+    assert time.monotonic() - start >= 0.045
+
+class FlakyWrite:
+    # Fails with the given exceptions in turn, then returns 'ok'
+    def __init__(self, *failures):
+        self.failures = list(failures)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.failures:
+            raise self.failures.pop(0)
+        return 'ok'
+
+@pytest.fixture(autouse=True)
+def fast_governor(monkeypatch):
+    monkeypatch.setattr(reddit_writer, 'governor', ratelimit.RateGovernor(rate=1000, capacity=1000))
+
+def test_write_retries_ratelimit():
+    write_fn = FlakyWrite(ratelimited('Take a break for 1 second'), ratelimited('Take a break for 2 seconds'))
+    assert reddit_writer.write('submit', write_fn) == 'ok'
+    assert write_fn.calls == 3
+
+def test_write_does_not_retry_other_errors():
+    write_fn = FlakyWrite(RedditAPIException(('ALREADY_SUB', 'that link has already been submitted')))
+    with pytest.raises(RedditAPIException):
+        reddit_writer.write('submit', write_fn)
+    assert write_fn.calls == 1
+
+def test_write_gives_up_on_long_ratelimits():
+    write_fn = FlakyWrite(ratelimited('Take a break for 15 minutes'))
+    with pytest.raises(RedditAPIException):
+        reddit_writer.write('submit', write_fn)
+    assert write_fn.calls == 1
+
+def test_write_gives_up_after_max_attempts():
+    write_fn = FlakyWrite(*[ratelimited('Take a break for 1 second')] * reddit_writer.MAX_ATTEMPTS)
+    with pytest.raises(RedditAPIException):
+        reddit_writer.write('submit', write_fn)
+    assert write_fn.calls == reddit_writer.MAX_ATTEMPTS
+
+def test_ratelimit_pauses_every_write_in_sleep_mode(monkeypatch):
+    monkeypatch.setenv('SLEEP_MODE', 'True')
+    write_fn = FlakyWrite(ratelimited('Take a break for 100 milliseconds'))
+    start = time.monotonic()
+    assert reddit_writer.write('reply', write_fn) == 'ok'
+    assert time.monotonic() - start >= 0.09
+    assert reddit_writer.governor.paused_until > 0
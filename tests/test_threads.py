@@ -0,0 +1,58 @@
+import json
+import pathlib
+from datetime import datetime, timedelta
+
+from tweepy.models import Status
+
+from sakuraitweetbot_function import threads
+
+FIXTURES = pathlib.Path(__file__).parent / 'fixtures'
+
+# Recorded user_timeline pages (tweet_mode=extended), newest first
+def load_timeline(name):
+    with open(FIXTURES / '{}.json'.format(name), encoding='utf-8') as f:
+        return [Status.parse(None, tweet) for tweet in json.load(f)]
+
+def media_url(name):
+    return 'https://pbs.twimg.com/media/{}.jpg?format=jpg&name=4096x4096'.format(name)
+
+def test_self_replies_join_the_media_root():
+    built = threads.build_threads(load_timeline('timeline_self_replies'))
+    assert len(built) == 1
+    thread = built[0]
+    assert thread.tweet_url == 'https://twitter.com/Sora_Sakurai/status/1580002'
+    assert thread.tweet_ids == [1580002, 1580003, 1580004]
+    assert thread.media_urls == [media_url('FezJq0aVIAEw7sn'), media_url('FezK2xVaUAAq3Lm'), media_url('FezK2xVaUAA9pRt')]
+    assert thread.text_list == ['今日の一枚', 'このステージは初代からの付き合いです。', '解説その２。影の付け方にも注目。']
+    assert thread.date == datetime(2022, 10, 13, 1, 30, 5) # tweepy 3 parses created_at as naive UTC
+
+def test_media_reply_to_another_user_is_dropped():
+    built = threads.build_threads(load_timeline('timeline_reply_to_other'))
+    assert [thread.tweet_ids for thread in built] == [[1590002]]
+    assert built[0].media_urls == [media_url('Fe4pT8xVEAAnS2q')]
+
+def test_unrelated_pics_become_separate_threads():
+    built = threads.build_threads(load_timeline('timeline_two_pics'))
+    assert [thread.tweet_ids for thread in built] == [[1600001, 1600002], [1600003, 1600004]]
+    assert [thread.text_list for thread in built] == [['今日の一枚', '後ろ姿にも注目。'], ['今日の一枚', '描き込みの細かさがわかります。']]
+
+def test_long_thread_single_pass(monkeypatch):
+    # A 1000 tweet self-reply chain, built from the recorded root and reply
+    root, reply = reversed(load_timeline('timeline_self_replies')[1:3])
+    tweets = [root]
+    for idx in range(1, 1000):
+        tweet = Status.parse(None, dict(reply._json, id=root.id + idx, in_reply_to_status_id=root.id + idx - 1,
+                                        full_text='{}'.format(idx), display_text_range=[0, len(str(idx))]))
+        tweet.created_at = root.created_at + timedelta(seconds=idx)
+        tweets.append(tweet)
+    tweets.reverse()
+
+    calls = []
+    tweet_media_urls = threads.tweet_media_urls
+    monkeypatch.setattr(threads, 'tweet_media_urls', lambda tweet: calls.append(tweet.id) or tweet_media_urls(tweet))
+
+    built = threads.build_threads(tweets)
+    assert len(built) == 1
+    assert built[0].tweet_ids == [root.id + idx for idx in range(1000)]
+    assert built[0].text_list == ['今日の一枚'] + [str(idx) for idx in range(1, 1000)]
+    assert sorted(calls) == built[0].tweet_ids # every tweet looked at exactly once
@@ -0,0 +1,143 @@
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+
+import pytest
+
+from sakuraitweetbot_function import timeline
+
+# Stand-in for statuses/user_timeline: since_id/max_id/count like twitter, and include_rts=False drops retweets
+# after count is applied, so a page can come back short or empty with older tweets left
+class FakeTimelineAPI:
+    def __init__(self, tweets):
+        self.tweets = tweets
+        self.calls = []
+
+    def user_timeline(self, **kwargs):
+        self.calls.append(kwargs)
+        since_id = kwargs.get('since_id', 0)
+        max_id = kwargs.get('max_id', float('inf'))
+        page = [tweet for tweet in sorted(self.tweets, key=lambda tweet: tweet.id, reverse=True) if since_id < tweet.id <= max_id][:kwargs['count']]
+        if not kwargs['include_rts']:
+            page = [tweet for tweet in page if not timeline.is_retweet(tweet)]
+        return page
+
+def tweet(tweet_id, retweet=False):
+    status = SimpleNamespace(id=tweet_id, created_at=datetime.utcnow() - timedelta(minutes=1000 - tweet_id))
+    if retweet:
+        status.retweeted_status = SimpleNamespace(id=tweet_id + 100000)
+    return status
+
+@pytest.fixture(autouse=True)
+def small_pages(monkeypatch):
+    monkeypatch.setattr(timeline, 'PAGE_SIZE', 2)
+    monkeypatch.setattr(timeline, 'MAX_PAGES', 2)
+
+def ids(tweets):
+    return [tweet.id for tweet in tweets]
+
+def cursor(since_id, posted=(), resume=None):
+    return {'since_id': since_id, 'posted': list(posted), 'resume': resume}
+
+def test_page_of_retweets_does_not_end_paging():
+    api = FakeTimelineAPI([tweet(101), tweet(102), tweet(103, retweet=True), tweet(104, retweet=True)])
+    fetch = timeline.fetch_new_tweets(api, 'Sora_Sakurai', cursor(100))
+    assert ids(fetch.tweets) == [102, 101]
+    assert fetch.since_id == 104
+    assert fetch.resume is None
+
+def test_cut_short_fetch_resumes_where_it_stopped():
+    api = FakeTimelineAPI([tweet(tweet_id) for tweet_id in range(101, 111)])
+    state = cursor(100)
+    fetched = []
+
+    fetch = timeline.fetch_new_tweets(api, 'Sora_Sakurai', state)
+    assert ids(fetch.tweets) == [110, 109, 108, 107]
+    assert fetch.resume == {'since_id': 100, 'max_id': 106}
+    fetched += ids(fetch.tweets)
+    state = timeline.advance_cursor(state, fetch, [], [])
+    assert state['since_id'] == 110
+
+    # Newer tweets first, then the rest of the unfinished fetch with what is left of the page budget
+    api.tweets += [tweet(111), tweet(112)]
+    while True:
+        fetch = timeline.fetch_new_tweets(api, 'Sora_Sakurai', state)
+        fetched += ids(fetch.tweets)
+        state = timeline.advance_cursor(state, fetch, [], [])
+        if state['resume'] is None:
+            break
+    assert sorted(fetched) == list(range(101, 113))
+    assert state['since_id'] == 112
+
+def test_cut_short_fetch_keeps_an_older_resume_point():
+    api = FakeTimelineAPI([tweet(tweet_id) for tweet_id in range(101, 111)])
+    fetch = timeline.fetch_new_tweets(api, 'Sora_Sakurai', cursor(104, resume={'since_id': 50, 'max_id': 90}))
+    assert ids(fetch.tweets) == [110, 109, 108, 107]
+    assert fetch.resume == {'since_id': 50, 'max_id': 106}
+
+def test_bootstrap_fetches_one_recent_page():
+    api = FakeTimelineAPI([tweet(tweet_id) for tweet_id in range(101, 111)])
+    fetch = timeline.fetch_new_tweets(api, 'Sora_Sakurai', cursor(None))
+    assert ids(fetch.tweets) == [110, 109]
+    assert fetch.since_id == 110
+    assert len(api.calls) == 1
+
+def test_fetched_posted_tweets_are_dropped():
+    api = FakeTimelineAPI([tweet(101), tweet(102)])
+    fetch = timeline.fetch_new_tweets(api, 'Sora_Sakurai', cursor(100, posted=[102]))
+    assert ids(fetch.tweets) == [101]
+    assert fetch.since_id == 102
+
+def fetched(since_id, resume=None):
+    return timeline.Fetch([], since_id, resume)
+
+def test_cursor_moves_to_newest_fetched_tweet():
+    state = timeline.advance_cursor(cursor(100), fetched(110), pending_ids={105, 106, 110}, posted_ids={105, 106, 110})
+    assert state == {'since_id': 110, 'posted': [105, 106, 110], 'resume': None}
+
+def test_failed_thread_pins_since_id_below_its_root():
+    # Threads 103-104 and 107-108 failed, 105-106 and 110 were posted
+    state = timeline.advance_cursor(cursor(100), fetched(110), pending_ids={103, 104, 105, 106, 107, 108, 110}, posted_ids={105, 106, 110})
+    assert state['since_id'] == 102
+    assert state['posted'] == [105, 106, 110]
+
+    # The next run fetches them again, the ledger keeps the posted ones from being posted twice
+    api = FakeTimelineAPI([tweet(tweet_id) for tweet_id in range(101, 111)])
+    fetch = timeline.fetch_new_tweets(api, 'Sora_Sakurai', state)
+    assert ids(fetch.tweets) == [109, 108, 107]
+    assert fetch.resume == {'since_id': 102, 'max_id': 106} # 103-104 next, past the page budget
+
+def test_since_id_never_moves_back():
+    state = timeline.advance_cursor(cursor(100), fetched(100), pending_ids={90}, posted_ids=set())
+    assert state['since_id'] == 100
+
+def test_failed_thread_from_a_resume_range_keeps_it_open():
+    state = timeline.advance_cursor(cursor(100), fetched(110, resume=None), pending_ids={60, 61, 105}, posted_ids={105})
+    assert state['since_id'] == 110
+    assert state['resume'] == {'since_id': 59, 'max_id': 61}
+
+    state = timeline.advance_cursor(cursor(100), fetched(110, resume={'since_id': 20, 'max_id': 50}), pending_ids={60, 61}, posted_ids=set())
+    assert state['resume'] == {'since_id': 20, 'max_id': 61}
+
+@pytest.mark.parametrize('resume', [None, {'since_id': 20, 'max_id': 50}])
+def test_custom_and_range_runs_leave_the_cursor(resume):
+    before = cursor(100, posted=[90], resume=resume)
+    state = timeline.advance_cursor(before, None, pending_ids=set(), posted_ids={40, 95})
+    assert state == {'since_id': 100, 'posted': [90, 40, 95], 'resume': resume}
+
+def test_ledger_is_capped(monkeypatch):
+    monkeypatch.setattr(timeline, 'LEDGER_SIZE', 5)
+    state = cursor(100, posted=[1, 2, 3, 4])
+    state = timeline.advance_cursor(state, fetched(110), pending_ids={107, 108, 109, 110}, posted_ids={107, 108, 109, 110, 4})
+    assert state['posted'] == [4, 107, 108, 109, 110]
+    state = timeline.advance_cursor(state, None, pending_ids=set(), posted_ids=set(range(200, 220)))
+    assert state['posted'] == list(range(215, 220))
+
+def test_cursor_round_trips(tmp_path, monkeypatch):
+    monkeypatch.setattr(timeline, 'CURSOR_PATH', tmp_path / 'timeline_cursor.json')
+    assert timeline.load_cursor() == cursor(None)
+    timeline.save_cursor(cursor(110, posted=[105], resume={'since_id': 20, 'max_id': 50}))
+    assert timeline.load_cursor() == cursor(110, posted=[105], resume={'since_id': 20, 'max_id': 50})
+
+    # A cursor saved before resume ranges existed
+    (tmp_path / 'timeline_cursor.json').write_text('{"since_id": 110, "posted": [105]}')
+    assert timeline.load_cursor() == cursor(110, posted=[105])
@@ -0,0 +1,99 @@
+import json
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from sakuraitweetbot_function import translation_cache
+from sakuraitweetbot_function import sakuraitweetbot
+from sakuraitweetbot_function.settings import config
+
+# Stand-in for Azure Translator v3 /translate: records every request body, "translates" by tagging the text
+class TranslatorHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        texts = [item['text'] for item in json.loads(self.rfile.read(int(self.headers['Content-Length'])))]
+        with self.server.guard:
+            self.server.requests.append(texts)
+        body = json.dumps([{'translations': [{'text': translated(text), 'to': 'en'}]} for text in texts]).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def translated(text):
+    return 'en:{}'.format(text)
+
+@pytest.fixture
+def translator(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), TranslatorHandler)
+    server.guard = threading.Lock()
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setitem(config['Azure'], 'TRANSLATE_ENDPOINT', 'http://127.0.0.1:{}/translate'.format(server.server_port))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture(autouse=True)
+def cache_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(translation_cache, 'CACHE_PATH', tmp_path / 'translations.sqlite')
+    return tmp_path / 'translations.sqlite'
+
+def translate(text_list):
+    return translation_cache.translate(text_list, 'ja', 'en', sakuraitweetbot.request_translations)
+
+def test_misses_then_hits(translator):
+    assert translate(['今日の一枚', '影に注目']) == [translated('今日の一枚'), translated('影に注目')]
+    assert translator.requests == [['今日の一枚', '影に注目']]
+
+    assert translate(['影に注目', '初代から', '今日の一枚']) == [translated('影に注目'), translated('初代から'), translated('今日の一枚')]
+    assert translator.requests[1:] == [['初代から']] # only the miss is sent
+
+    assert translate(['今日の一枚']) == [translated('今日の一枚')]
+    assert len(translator.requests) == 2
+
+def test_repeated_strings_sent_once(translator):
+    # The same string repeated, or differing only in unicode form, line endings or padding
+    texts = ['今日の一枚', 'がんばる', ' 今日の一枚 ', 'か\u3099んばる', '一行目\r\n二行目', '一行目\n二行目', '今日の一枚']
+    result = translate(texts)
+    assert translator.requests == [['今日の一枚', 'がんばる', '一行目\n二行目']]
+    assert result == [translated('今日の一枚'), translated('がんばる'), translated('今日の一枚'), translated('がんばる'),
+                      translated('一行目\n二行目'), translated('一行目\n二行目'), translated('今日の一枚')]
+
+def test_empty_list_sends_nothing(translator):
+    assert translate([]) == []
+    assert translator.requests == []
+
+def test_batches_split_at_max_texts(translator, monkeypatch):
+    monkeypatch.setattr(translation_cache, 'MAX_BATCH_TEXTS', 3)
+    texts = ['テキスト{}'.format(idx) for idx in range(7)]
+    assert translate(texts) == [translated(text) for text in texts]
+    assert translator.requests == [texts[0:3], texts[3:6], texts[6:7]]
+
+def test_batches_split_at_max_chars(translator, monkeypatch):
+    monkeypatch.setattr(translation_cache, 'MAX_BATCH_CHARS', 10)
+    texts = ['あ' * 4, 'い' * 4, 'う' * 2, 'え' * 9, 'お' * 12]
+    assert translate(texts) == [translated(text) for text in texts]
+    # A text longer than the limit still goes out, in a request of its own
+    assert translator.requests == [texts[0:3], texts[3:4], texts[4:5]]
+
+def test_cache_survives_reopen(translator, cache_path):
+    translate(['今日の一枚'])
+    with sqlite3.connect(str(cache_path)) as connection:
+        assert connection.execute('SELECT source, translation FROM translations').fetchall() == [('今日の一枚', translated('今日の一枚'))]
+
+    # Every lookup opens the file anew, as the next invocation would; a hit needs no translator at all
+    def unavailable(texts):
+        raise AssertionError('translator called for {}'.format(texts))
+    assert translation_cache.translate(['今日の一枚'], 'ja', 'en', unavailable) == [translated('今日の一枚')]
+    assert translation_cache.translate(['今日の一枚'], 'ja', 'fr', lambda texts: ['fr:' + text for text in texts]) == ['fr:今日の一枚']
+
+def test_unreadable_cache_still_translates(translator, cache_path):
+    cache_path.mkdir() # sqlite can't open a directory
+    assert translate(['今日の一枚']) == [translated('今日の一枚')]